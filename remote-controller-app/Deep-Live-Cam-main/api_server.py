@@ -1,29 +1,42 @@
 import os
-import cv2
-import numpy as np
 import io
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import modules.globals as g
-from modules.face_analyser import get_one_face
+from modules.face_analyser import get_one_face, get_detection_size_usage
 from modules.processors.frame.core import get_frame_processors_modules
-from PIL import Image
+from modules.frame_context import FrameContext
+from modules.core import decode_execution_providers
+from modules.onnx_session import print_session_config
+from modules.frame_codec import decode_image, encode_jpeg, get_backend_name
+from modules.filter_cache import FilterCache
+from modules.filter_index import FilterIndex
+from modules.capture_pipeline import CapturePipeline
 import threading
+import time
 import sys
 import glob
 import platform
+import json
+import uuid
 
 # Windows용 웹캠 이름 가져오기
+from modules.camera_registry import FILTERGRAPH_AVAILABLE, get_camera_registry
+if not FILTERGRAPH_AVAILABLE:
+    print("Warning: pygrabber not available. Camera names will be generic.")
+
+# WebSocket 프레임 스트리밍
 try:
-    from pygrabber.dshow_graph import FilterGraph
-    FILTERGRAPH_AVAILABLE = True
+    from flask_sock import Sock
+    SOCK_AVAILABLE = True
 except ImportError:
-    FILTERGRAPH_AVAILABLE = False
-    print("Warning: pygrabber not available. Camera names will be generic.")
+    SOCK_AVAILABLE = False
+    print("Warning: flask-sock not available. Frame streaming over WebSocket is disabled.")
 
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app) if SOCK_AVAILABLE else None
 
 # --- Global State ---
 SOURCE_FACE = None
@@ -31,6 +44,35 @@ FRAME_PROCESSORS = None
 MOUTH_MASK_ENABLED = False
 CURRENT_FILTER = None
 CURRENT_CAMERA_INDEX = 0
+CAPTURE_PIPELINE = None
+CAPTURE_LOCK = threading.Lock()
+
+# --- Processor Settings ---
+EXECUTION_PROVIDER = os.environ.get('EXECUTION_PROVIDER', 'cpu')
+FACE_ENHANCER_ENABLED = os.environ.get('FACE_ENHANCER', 'false').lower() == 'true'
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', '85'))
+FRAME_DECODE_SCALE = int(os.environ.get('FRAME_DECODE_SCALE', '1'))
+MASK_REUSE_THRESHOLD = float(os.environ.get('MASK_REUSE_THRESHOLD', '0'))
+FACE_TRACKING_ENABLED = os.environ.get('FACE_TRACKING', 'false').lower() == 'true'
+FACE_TRACKING_INTERVAL = int(os.environ.get('FACE_TRACKING_INTERVAL', '5'))
+ADAPTIVE_DETECTION_ENABLED = os.environ.get('ADAPTIVE_DETECTION', 'false').lower() == 'true'
+ENHANCER_BATCH_SIZE = int(os.environ.get('ENHANCER_BATCH_SIZE', '4'))
+ENHANCER_BATCH_WAIT = float(os.environ.get('ENHANCER_BATCH_WAIT_MS', '5'))
+ENHANCER_BACKEND = os.environ.get('ENHANCER_BACKEND', 'torch')
+ORT_INTRA_OP_THREADS = int(os.environ.get('ORT_INTRA_OP_THREADS', '0'))
+ORT_INTER_OP_THREADS = int(os.environ.get('ORT_INTER_OP_THREADS', '0'))
+ORT_GRAPH_OPTIMIZATION = os.environ.get('ORT_GRAPH_OPTIMIZATION', 'all')
+ORT_CACHE_DIR = os.environ.get('ORT_CACHE_DIR') or None
+ORT_PROVIDER_OPTIONS = json.loads(os.environ.get('ORT_PROVIDER_OPTIONS', '{}'))
+
+# 디코딩된 필터 이미지와 추출된 얼굴 캐시
+FILTER_CACHE = FilterCache(
+    max_entries=int(os.environ.get('FILTER_CACHE_ENTRIES', '16')),
+    max_bytes=int(os.environ.get('FILTER_CACHE_MB', '256')) * 1024 ** 2,
+)
+
+# media/ 필터 얼굴 인덱스 (백그라운드에서 생성 및 갱신)
+FILTER_INDEX = FilterIndex('media')
 
 def get_pin_from_file():
     """Reads the PIN from the password.txt file."""
@@ -46,6 +88,13 @@ PIN_CODE = get_pin_from_file()
 def find_filter_path(filter_name):
     """Searches for a filter in the media directory, first as .png, then as .jpg."""
     secure_name = secure_filename(filter_name)
+
+    # Once the filter index has scanned media/, it answers hits from memory;
+    # a miss still probes the disk, the file may be newer than the last scan
+    if FILTER_INDEX.ready:
+        filter_path = FILTER_INDEX.find(secure_name)
+        if filter_path is not None:
+            return filter_path
     
     # 1. Check for .png
     png_path = os.path.join('media', f"{secure_name}.png")
@@ -60,23 +109,57 @@ def find_filter_path(filter_name):
     return None
 
 def initialize_processors():
-    """Initialize the frame processors."""
+    """
+    Loads the frame processors once and warms up their models,
+    so the first live frame does not pay for lazy model loading.
+    """
     global FRAME_PROCESSORS
-    # g.source_path = "source.jpg" # Dummy
-    # g.target_path = "target.jpg" # Dummy
-    # g.output_path = "output.jpg" # Dummy
-    
-    # processors = ['face_swapper']
-    # if MOUTH_MASK_ENABLED:
-    #     processors.append('mouth_mask')
-    
-    # g.frame_processors = processors
-    # FRAME_PROCESSORS = get_frame_processors_modules(g.frame_processors)
-    # for processor in FRAME_PROCESSORS:
-    #     # Some processors might have pre-start actions
-    #     if hasattr(processor, 'pre_start'):
-    #         processor.pre_start()
-    print("Frame processors initialization skipped.")
+    g.mouth_mask = MOUTH_MASK_ENABLED
+    if FRAME_PROCESSORS is not None:
+        return
+
+    if not g.execution_providers:
+        g.execution_providers = decode_execution_providers([EXECUTION_PROVIDER])
+    g.frame_processors = ['face_swapper']
+    g.mask_reuse_threshold = MASK_REUSE_THRESHOLD
+    g.face_tracking = FACE_TRACKING_ENABLED
+    g.face_tracking_interval = FACE_TRACKING_INTERVAL
+    g.adaptive_detection = ADAPTIVE_DETECTION_ENABLED
+    g.enhancer_batch_size = ENHANCER_BATCH_SIZE
+    g.enhancer_batch_wait = ENHANCER_BATCH_WAIT
+    g.enhancer_backend = ENHANCER_BACKEND
+    g.ort_intra_op_threads = ORT_INTRA_OP_THREADS
+    g.ort_inter_op_threads = ORT_INTER_OP_THREADS
+    g.ort_graph_optimization = ORT_GRAPH_OPTIMIZATION
+    g.ort_cache_dir = ORT_CACHE_DIR
+    g.ort_provider_options = ORT_PROVIDER_OPTIONS
+    print_session_config()
+    g.fp_ui['face_enhancer'] = FACE_ENHANCER_ENABLED
+
+    processors = []
+    for processor in get_frame_processors_modules(g.frame_processors):
+        # pre_check downloads the models, and exports the ONNX enhancer when that backend is selected
+        if not processor.pre_check():
+            print(f"{processor.NAME} disabled: its models are not available")
+            continue
+        processors.append(processor)
+
+    for processor in processors:
+        # Processors without a warm-up step load their models on first use
+        if hasattr(processor, 'warm_up'):
+            start_time = time.perf_counter()
+            processor.warm_up()
+            print(f"{processor.NAME} warmed up in {time.perf_counter() - start_time:.2f}s")
+
+    FRAME_PROCESSORS = processors
+    print(f"Frame processors initialized: {g.frame_processors} ({g.execution_providers})")
+    print(f"JPEG codec: {get_backend_name()} (quality {JPEG_QUALITY}, decode scale 1/{FRAME_DECODE_SCALE})")
+
+def prepare_source():
+    """Lets the processors precompute what they derive from SOURCE_FACE, such as the swapper latent."""
+    for processor in FRAME_PROCESSORS:
+        if hasattr(processor, 'prepare_source'):
+            processor.prepare_source(SOURCE_FACE)
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -149,20 +232,19 @@ def start_processing():
         return jsonify({"error": "필터를 먼저 설정해야 합니다."}), 400
         
     try:
-        # Load the image from the path stored in CURRENT_FILTER
-        img = cv2.imread(CURRENT_FILTER)
-        if img is None:
+        # Use the precomputed face from the filter index, falling back to the
+        # cache (which analyses the image) for filters that are not indexed yet
+        entry = FILTER_INDEX.get(CURRENT_FILTER) or FILTER_CACHE.get(CURRENT_FILTER)
+        if entry is None:
             return jsonify({'error': '필터 이미지 파일을 불러올 수 없습니다.'}), 400
         
-        # Get one face from the loaded image
-        face = get_one_face(img)
-        if not face:
+        if not entry.face:
             return jsonify({'error': '필터 이미지에서 얼굴을 찾을 수 없습니다.'}), 400
         
-        # Set the global source face and initialize processors for face swapping
-        SOURCE_FACE = face
-        # Assuming mouth_mask is not needed for this controller version
-        initialize_processors() 
+        # Set the global source face; processors are only loaded on the first call
+        SOURCE_FACE = entry.face
+        initialize_processors()
+        prepare_source()
         
         print(f"START successful. Source face set from: {CURRENT_FILTER}")
         return jsonify({"status": "started"})
@@ -171,12 +253,78 @@ def start_processing():
         print(f"Error during start processing: {e}")
         return jsonify({"error": "필터 준비 중 오류가 발생했습니다."}), 500
 
+def process_live_frame(frame):
+    """Swaps faces on a captured frame, or passes it through until a source face is set."""
+    if SOURCE_FACE is None or FRAME_PROCESSORS is None:
+        return frame
+    return apply_processors(frame)
+
+def start_capture():
+    """Starts server-side capture from CURRENT_CAMERA_INDEX. Call with CAPTURE_LOCK held."""
+    global CAPTURE_PIPELINE
+    pipeline = CapturePipeline(CURRENT_CAMERA_INDEX, process_live_frame, encode_frame)
+    # Marked before the device opens, so a registry refresh never probes it
+    get_camera_registry().mark_in_use(pipeline.device_index)
+    if not pipeline.start():
+        get_camera_registry().mark_in_use(pipeline.device_index, False)
+        return False
+    CAPTURE_PIPELINE = pipeline
+    return True
+
+def stop_capture():
+    """Stops server-side capture if it is running. Call with CAPTURE_LOCK held."""
+    global CAPTURE_PIPELINE
+    if CAPTURE_PIPELINE is None:
+        return
+    CAPTURE_PIPELINE.stop()
+    get_camera_registry().mark_in_use(CAPTURE_PIPELINE.device_index, False)
+    print(f"Capture stopped: {CAPTURE_PIPELINE.stats()}")
+    CAPTURE_PIPELINE = None
+
 @app.route('/live', methods=['POST'])
 def live_processing():
-    """Placeholder to toggle a live mode."""
+    """
+    Toggles live mode: server-side capture from the selected camera,
+    with the processed frames served as MJPEG from /stream.
+    """
     print("LIVE command received.")
-    # Add your live mode logic here
-    return jsonify({"status": "live_mode_toggled"})
+    with CAPTURE_LOCK:
+        if CAPTURE_PIPELINE is not None and CAPTURE_PIPELINE.is_running:
+            stop_capture()
+            return jsonify({"status": "live_mode_toggled", "live": False})
+
+        stop_capture()
+        if not start_capture():
+            return jsonify({"error": f"인덱스 {CURRENT_CAMERA_INDEX}의 카메라를 열 수 없습니다."}), 500
+    print(f"Live capture started on camera {CURRENT_CAMERA_INDEX}")
+    return jsonify({"status": "live_mode_toggled", "live": True})
+
+@app.route('/stream', methods=['GET'])
+def stream():
+    """Streams the processed live capture as MJPEG (multipart/x-mixed-replace)."""
+    pipeline = CAPTURE_PIPELINE
+    if pipeline is None or not pipeline.is_running:
+        return jsonify({"error": "Live mode is not running"}), 400
+
+    def generate():
+        sequence = 0
+        while pipeline.is_running:
+            frame = pipeline.wait_for_frame(sequence)
+            if frame is None:
+                continue
+            sequence, data = frame
+            yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                   + str(len(data)).encode() + b'\r\n\r\n' + data + b'\r\n')
+
+    return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/capture_stats', methods=['GET'])
+def capture_stats():
+    """Returns the captured, processed and dropped frame counts of live mode."""
+    pipeline = CAPTURE_PIPELINE
+    if pipeline is None:
+        return jsonify({"running": False})
+    return jsonify(pipeline.stats())
 
 @app.route('/reset', methods=['POST'])
 def reset_server():
@@ -197,66 +345,10 @@ def reset_server():
 def list_cameras():
     """
     사용 가능한 카메라 목록을 반환합니다.
+    The list comes from the camera registry, which probes devices in the background.
     """
-    cameras = []
-    
     try:
-        import cv2
-        import platform
-        
-        system = platform.system()
-        print(f"시스템: {system}")
-        
-        # Windows에서 실제 웹캠 이름 가져오기
-        camera_names = {}
-        if system == "Windows" and FILTERGRAPH_AVAILABLE:
-            try:
-                graph = FilterGraph()
-                devices = graph.get_input_devices()
-                for i, device_name in enumerate(devices):
-                    camera_names[i] = device_name
-                print(f"Windows 웹캠 감지: {camera_names}")
-            except Exception as e:
-                print(f"Windows 웹캠 이름 가져오기 실패: {e}")
-        
-        # OpenCV로 사용 가능한 카메라 감지
-        for i in range(5):  # 최대 5개까지 확인
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                # 실제로 프레임을 읽을 수 있는지 확인
-                ret, frame = cap.read()
-                if not ret or frame is None:
-                    cap.release()
-                    continue
-                
-                # 해상도 확인
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                
-                # 실제 웹캠 이름 사용
-                if i in camera_names:
-                    camera_name = camera_names[i]
-                else:
-                    # 기본 이름 생성
-                    if system == "Windows":
-                        camera_name = f"Camera {i}"
-                    elif system == "Darwin":  # macOS
-                        camera_name = f"FaceTime HD Camera" if i == 0 else f"Camera {i}"
-                    else:  # Linux
-                        camera_name = f"/dev/video{i}"
-                
-                cameras.append({
-                    'index': i,
-                    'name': camera_name,
-                    'width': width,
-                    'height': height,
-                    'fps': int(fps) if fps > 0 else 30
-                })
-                
-                print(f"카메라 {i}: {camera_name} - {width}x{height}@{fps}fps")
-                cap.release()
-        
+        cameras = [camera.to_dict() for camera in get_camera_registry().cameras()]
         print(f"총 {len(cameras)}개의 웹캠 감지됨")
         return jsonify({'cameras': cameras})
         
@@ -267,7 +359,7 @@ def list_cameras():
 @app.route('/set_camera', methods=['POST'])
 def set_camera():
     """
-    Sets the active camera device by index, validating if it can be opened.
+    Sets the active camera device by index, validating it against the camera registry.
     """
     global CURRENT_CAMERA_INDEX
     data = request.get_json()
@@ -277,16 +369,28 @@ def set_camera():
     try:
         new_index = int(data['camera_index'])
         
-        # 실제로 카메라를 열 수 있는지 확인
-        cap = cv2.VideoCapture(new_index)
-        if not cap.isOpened():
-            cap.release()
-            print(f"Failed to open camera at index: {new_index}")
+        # 레지스트리에 등록된 카메라인지 확인 (장치를 다시 열지 않음)
+        if get_camera_registry().get(new_index) is None:
+            get_camera_registry().request_refresh()
+            print(f"Camera not available at index: {new_index}")
             return jsonify({"error": f"인덱스 {new_index}의 카메라를 열 수 없습니다."}), 404
-            
-        cap.release() # 확인 후 바로 해제
         
-        CURRENT_CAMERA_INDEX = new_index
+        with CAPTURE_LOCK:
+            CURRENT_CAMERA_INDEX = new_index
+            # Move a running live capture over to the new camera
+            if CAPTURE_PIPELINE is not None and CAPTURE_PIPELINE.device_index != new_index:
+                previous_index = CAPTURE_PIPELINE.device_index
+                stop_capture()
+                if not start_capture():
+                    # Keep the live capture going on the camera it had
+                    CURRENT_CAMERA_INDEX = previous_index
+                    restarted = start_capture()
+                    print(f"Could not move live capture to camera {new_index}, restarted on {previous_index}: {restarted}")
+                    return jsonify({
+                        "error": f"인덱스 {new_index}의 카메라를 열 수 없습니다.",
+                        "current_camera": CURRENT_CAMERA_INDEX,
+                        "live": restarted,
+                    }), 500
         print(f"Camera index set to: {CURRENT_CAMERA_INDEX}")
         return jsonify({"status": "camera_set", "current_camera": CURRENT_CAMERA_INDEX})
         
@@ -318,9 +422,7 @@ def set_source():
         return jsonify({"error": "No source face image provided"}), 400
 
     try:
-        image = Image.open(source_face_file.stream).convert("RGB")
-        img = np.array(image)
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        img = decode_image(read_upload_buffer(source_face_file))
     except Exception as e:
         print(f"Error processing source image: {e}")
         return jsonify({"error": "Invalid or corrupt image file"}), 400
@@ -328,33 +430,180 @@ def set_source():
     if img is None:
         return jsonify({"error": "Failed to decode image"}), 400
 
-    # face = get_one_face(img) # This line is commented out as get_one_face is no longer imported
-    # if not face:
-    #     return jsonify({'error': 'No face found in the source image'}), 400
-    
-    # SOURCE_FACE = face
-    # MOUTH_MASK_ENABLED = request.form.get('mouth_mask') == 'true'
-    
-    # # Initialize (or re-initialize) processors with the new settings
-    # initialize_processors()
+    face = get_one_face(img)
+    if not face:
+        return jsonify({'error': 'No face found in the source image'}), 400
+
+    SOURCE_FACE = face
+    MOUTH_MASK_ENABLED = request.form.get('mouth_mask') == 'true'
+
+    # Initialize processors on first use and apply the new mouth mask setting
+    initialize_processors()
+    prepare_source()
     
     print("Source face and settings have been set.")
     return jsonify({'status': 'source_set'})
 
+def read_upload_buffer(file_storage):
+    """Returns the bytes of an uploaded file, without a copy when it is held in memory."""
+    stream = file_storage.stream
+    if hasattr(stream, 'getbuffer'):
+        return stream.getbuffer()
+    return stream.read()
+
+def decode_frame(buffer):
+    """Decodes a JPEG frame buffer straight into a BGR frame."""
+    return decode_image(buffer, FRAME_DECODE_SCALE)
+
+def encode_frame(frame):
+    """Encodes a BGR frame as JPEG bytes."""
+    return encode_jpeg(frame, JPEG_QUALITY)
+
+def apply_processors(frame):
+    """Runs the loaded frame processors over a frame using the stored source face."""
+    frame_context = FrameContext(live=True)
+    for processor in FRAME_PROCESSORS:
+        frame = processor.process_frame(SOURCE_FACE, frame, frame_context)
+    return frame
+
+class FrameJob:
+    """A frame waiting in a FrameScheduler, with its result once processed."""
+    def __init__(self, frame):
+        self.frame = frame
+        self.result = None
+        self.error = None
+        self.dropped = False
+        self.done = threading.Event()
+
+class FrameScheduler:
+    """
+    Latest-frame-wins scheduler for one client session.
+    Only the newest submitted frame is kept pending; an older pending frame is
+    dropped when a newer one arrives. Frames are processed one at a time on a
+    dedicated worker thread, so request threads never pile up on the processors.
+    """
+    def __init__(self, session_id, process, on_result=None):
+        self.session_id = session_id
+        self.processed = 0
+        self.dropped = 0
+        self.last_active = time.monotonic()
+        self._process = process
+        self._on_result = on_result
+        self._pending = None
+        self._busy = False
+        self._running = True
+        self._condition = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name=f"frame-scheduler-{session_id}", daemon=True)
+        self._worker.start()
+
+    def submit(self, frame):
+        """Queues a frame, dropping the frame that was still pending, and returns its job."""
+        job = FrameJob(frame)
+        with self._condition:
+            if self._pending is not None:
+                self._drop(self._pending)
+            self._pending = job
+            self.last_active = time.monotonic()
+            self._condition.notify()
+        return job
+
+    def stats(self):
+        """Returns the processed, dropped and queued frame counts of this session."""
+        with self._condition:
+            return {
+                'session_id': self.session_id,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'queued': 1 if self._pending is not None else 0,
+                'busy': self._busy,
+            }
+
+    def is_idle(self, timeout):
+        with self._condition:
+            return (self._pending is None and not self._busy
+                    and time.monotonic() - self.last_active > timeout)
+
+    def close(self):
+        """Stops the worker; a frame that is still pending is dropped."""
+        with self._condition:
+            self._running = False
+            if self._pending is not None:
+                self._drop(self._pending)
+                self._pending = None
+            self._condition.notify()
+
+    def _drop(self, job):
+        job.dropped = True
+        self.dropped += 1
+        job.done.set()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._pending is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                job, self._pending = self._pending, None
+                self._busy = True
+
+            try:
+                job.result = self._process(job.frame)
+            except Exception as e:
+                print(f"Error processing frame in session {self.session_id}: {e}")
+                job.error = e
+
+            with self._condition:
+                self._busy = False
+                if job.error is None:
+                    self.processed += 1
+            job.done.set()
+            if self._on_result:
+                self._on_result(job)
+
+FRAME_SCHEDULERS = {}  # /process_frame sessions, closed when idle
+STREAM_SCHEDULERS = {}  # WebSocket sessions, closed on disconnect
+FRAME_SCHEDULERS_LOCK = threading.Lock()
+SESSION_IDLE_TIMEOUT = 60.0
+FRAME_WAIT_TIMEOUT = 10.0
+
+def process_and_encode(frame):
+    return encode_frame(apply_processors(frame))
+
+def get_frame_scheduler(session_id):
+    """Returns the scheduler of a session, creating it and closing idle ones."""
+    with FRAME_SCHEDULERS_LOCK:
+        for idle_id in [key for key, scheduler in FRAME_SCHEDULERS.items()
+                        if key != session_id and scheduler.is_idle(SESSION_IDLE_TIMEOUT)]:
+            FRAME_SCHEDULERS.pop(idle_id).close()
+        scheduler = FRAME_SCHEDULERS.get(session_id)
+        if scheduler is None:
+            scheduler = FrameScheduler(session_id, process_and_encode)
+            FRAME_SCHEDULERS[session_id] = scheduler
+        return scheduler
+
 @app.route('/process_frame', methods=['POST'])
 def process_frame():
-    """Processes a single frame sent from the browser."""
-    if SOURCE_FACE is None: # or FRAME_PROCESSORS is None:
+    """
+    Processes a frame sent from the browser through the session's scheduler.
+    Every client sends its own session_id form field; a request without one is
+    refused with a generated id to send back.
+    Answers 204 when the frame was dropped because a newer one arrived first.
+    """
+    if SOURCE_FACE is None or FRAME_PROCESSORS is None:
         return jsonify({'error': 'Source face not set or processors not initialized'}), 400
 
     frame_file = request.files.get('frame')
     if not frame_file:
         return jsonify({'error': 'No frame data provided'}), 400
+
+    # Clients behind one address must not share a scheduler and drop each other's frames
+    session_id = request.form.get('session_id')
+    if not session_id:
+        return jsonify({'error': 'No session_id provided', 'session_id': uuid.uuid4().hex}), 400
     
     try:
-        image = Image.open(frame_file.stream).convert("RGB")
-        target_frame = np.array(image)
-        target_frame = cv2.cvtColor(target_frame, cv2.COLOR_RGB2BGR)
+        target_frame = decode_frame(read_upload_buffer(frame_file))
     except Exception as e:
         print(f"Error processing video frame: {e}")
         return jsonify({'error': 'Could not decode frame'}), 400
@@ -362,28 +611,93 @@ def process_frame():
     if target_frame is None:
         return jsonify({'error': 'Could not decode frame'}), 400
 
-    # If a filter is set, you might apply it here as an overlay, for example
-    if CURRENT_FILTER:
+    job = get_frame_scheduler(session_id).submit(target_frame)
+    if not job.done.wait(FRAME_WAIT_TIMEOUT):
+        return jsonify({'error': 'Frame processing timed out'}), 503
+    if job.dropped:
+        return '', 204
+    if job.error is not None:
+        return jsonify({'error': 'Frame processing failed'}), 500
+
+    # Send the processed JPEG frame back
+    return send_file(io.BytesIO(job.result), mimetype='image/jpeg')
+
+@app.route('/frame_stats', methods=['GET'])
+def frame_stats():
+    """Returns the frame counts of every session and the enhancer batching metrics."""
+    with FRAME_SCHEDULERS_LOCK:
+        schedulers = list(FRAME_SCHEDULERS.values()) + list(STREAM_SCHEDULERS.values())
+    enhancer = next((processor for processor in FRAME_PROCESSORS or [] if hasattr(processor, 'get_enhancer_stats')), None)
+    return jsonify({
+        'sessions': [scheduler.stats() for scheduler in schedulers],
+        'detection_sizes': get_detection_size_usage(),
+        'enhancer': enhancer.get_enhancer_stats() if enhancer else None,
+    })
+
+def stream_frames(ws):
+    """
+    Streams frames over one WebSocket session.
+    The client sends JPEG frames as binary messages and gets each processed frame
+    back as a binary message. Frames go through a FrameScheduler, so a frame that
+    is still pending when a newer one arrives is dropped instead of queued.
+    A text message is answered with the session counters as JSON.
+    """
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            ws.send(message)
+
+    def on_result(job):
         try:
-            filter_img = cv2.imread(CURRENT_FILTER, cv2.IMREAD_UNCHANGED)
-            # This is a placeholder for actual filter application logic
-            # For example, resizing and overlaying the filter
-        except Exception as e:
-            print(f"Could not apply filter: {e}")
-
-    # # Process the frame using the stored source face
-    # for processor in FRAME_PROCESSORS:
-    #     target_frame = processor.process_frame(
-    #         source_face=SOURCE_FACE,
-    #         temp_frame=target_frame
-    #     )
-
-    # Encode the processed frame to JPEG and send it back
-    _, img_encoded = cv2.imencode('.jpg', target_frame)
-    return send_file(io.BytesIO(img_encoded), mimetype='image/jpeg')
+            if job.error is not None:
+                send(json.dumps({'error': 'Frame processing failed'}))
+            else:
+                send(job.result)
+        except Exception:
+            # The client went away; the receive loop ends the session
+            pass
+
+    scheduler = FrameScheduler(f"ws-{id(ws)}", process_and_encode, on_result)
+    with FRAME_SCHEDULERS_LOCK:
+        STREAM_SCHEDULERS[scheduler.session_id] = scheduler
+    print(f"Frame stream opened: {scheduler.session_id}")
+    try:
+        while True:
+            data = ws.receive()
+            if isinstance(data, str):
+                send(json.dumps(scheduler.stats()))
+                continue
+
+            if SOURCE_FACE is None or FRAME_PROCESSORS is None:
+                send(json.dumps({'error': 'Source face not set or processors not initialized'}))
+                continue
+
+            try:
+                target_frame = decode_frame(data)
+            except Exception as e:
+                print(f"Error processing streamed frame: {e}")
+                send(json.dumps({'error': 'Could not decode frame'}))
+                continue
+
+            if target_frame is None:
+                send(json.dumps({'error': 'Could not decode frame'}))
+                continue
+
+            scheduler.submit(target_frame)
+    finally:
+        with FRAME_SCHEDULERS_LOCK:
+            STREAM_SCHEDULERS.pop(scheduler.session_id, None)
+        scheduler.close()
+        print(f"Frame stream closed: {scheduler.stats()}")
+
+if SOCK_AVAILABLE:
+    sock.route('/ws/process_frame')(stream_frames)
 
 if __name__ == '__main__':
-    # Initialize processors at startup with a default state
+    # Load and warm up processors before accepting frames
     initialize_processors()
+    FILTER_INDEX.start()
+    get_camera_registry()
     # Using Gunicorn in Docker, this is for local testing
     app.run(host='0.0.0.0', port=8080) 
\ No newline at end of file
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compares the API frame codec (modules.frame_codec) with the previous
+PIL decode + cvtColor + default imencode path at 480p, 720p and 1080p.
+
+Usage: python benchmarks/frame_codec_benchmark.py [--iterations 200] [--quality 85]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.frame_codec import decode_image, encode_jpeg, get_backend_name  # noqa: E402
+
+RESOLUTIONS = {
+    '480p': (640, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+def make_test_jpeg(width: int, height: int) -> bytes:
+    # Smooth gradients plus noise compress roughly like a webcam frame
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.dstack([x + 0 * y, y + 0 * x, (x + y) / 2])
+    frame += np.random.default_rng(0).normal(0, 8, frame.shape)
+    frame = np.clip(frame, 0, 255).astype(np.uint8)
+    _, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+
+def legacy_round_trip(data: bytes) -> bytes:
+    image = Image.open(io.BytesIO(data)).convert("RGB")
+    frame = np.array(image)
+    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    _, encoded = cv2.imencode('.jpg', frame)
+    return encoded.tobytes()
+
+
+def codec_round_trip(data: bytes, quality: int, scale: int = 1) -> bytes:
+    return encode_jpeg(decode_image(data, scale), quality)
+
+
+def measure(function, iterations: int) -> float:
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--quality', type=int, default=85)
+    args = parser.parse_args()
+
+    print(f"codec backend: {get_backend_name()}, iterations: {args.iterations}, quality: {args.quality}")
+    print(f"{'resolution':<12}{'legacy ms':>12}{'codec ms':>12}{'speedup':>10}{'codec 1/2 ms':>15}")
+    for name, (width, height) in RESOLUTIONS.items():
+        data = make_test_jpeg(width, height)
+        legacy = measure(lambda: legacy_round_trip(data), args.iterations)
+        codec = measure(lambda: codec_round_trip(data, args.quality), args.iterations)
+        reduced = measure(lambda: codec_round_trip(data, args.quality, 2), args.iterations)
+        print(f"{name:<12}{legacy:>12.2f}{codec:>12.2f}{legacy / codec:>9.2f}x{reduced:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
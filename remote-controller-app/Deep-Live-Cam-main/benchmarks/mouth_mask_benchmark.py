@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Compares the ROI mouth mask pipeline (modules.mouth_mask) with the previous
+full-frame float64 implementation at 720p and 1080p, for one synthetic face
+covering about a third of the frame height. The reuse column runs the ROI
+pipeline through modules.mask_cache while the face drifts by a pixel a frame.
+
+Usage: python benchmarks/mouth_mask_benchmark.py [--iterations 100] [--threshold 2]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import modules.globals  # noqa: E402
+from modules.mask_cache import MaskCache  # noqa: E402
+from modules.mouth_mask import (  # noqa: E402
+    apply_mouth_area,
+    create_mouth_masks,
+    get_mouth_cutout,
+    get_mouth_mask_geometry,
+)
+
+RESOLUTIONS = {
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+class SyntheticFace:
+    def __init__(self, landmark_2d_106: np.ndarray):
+        self.landmark_2d_106 = landmark_2d_106
+
+
+def make_test_face(width: int, height: int) -> SyntheticFace:
+    # Only the points the masks read are placed: jaw contour, eyebrows and lips
+    cx, cy = width / 2, height / 2
+    radius = height / 6
+    landmarks = np.tile([cx, cy], (106, 1)).astype(np.float32)
+    landmarks[0] = (cx, cy + radius * 1.2)
+    for i in range(1, 17):
+        angle = np.pi / 2 - i * np.pi / 32
+        landmarks[i] = (cx + radius * np.cos(angle), cy + radius * 1.2 * np.sin(angle))
+        landmarks[i + 16] = (cx - radius * np.cos(angle), cy + radius * 1.2 * np.sin(angle))
+    landmarks[43:51, 0] = np.linspace(cx + radius * 0.2, cx + radius * 0.8, 8)
+    landmarks[97:105, 0] = np.linspace(cx - radius * 0.8, cx - radius * 0.2, 8)
+    landmarks[43:51, 1] = landmarks[97:105, 1] = cy - radius * 0.4
+    for index, offset in zip([65, 66, 62, 70, 69], np.linspace(-0.35, 0.35, 5)):
+        landmarks[index] = (cx + radius * offset, cy + radius * 0.5)
+    return SyntheticFace(landmarks)
+
+
+def make_test_frame(width: int, height: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    frame = cv2.resize(rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8), (width, height))
+    return cv2.add(frame, rng.integers(0, 16, frame.shape, dtype=np.uint8))
+
+
+def legacy_create_face_mask(face, frame):
+    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+    landmarks = face.landmark_2d_106.astype(np.int32)
+    right_side_face = landmarks[0:16]
+    left_side_face = landmarks[17:32]
+    eyebrow_top = min(np.min(landmarks[43:51, 1]), np.min(landmarks[97:105, 1]))
+    face_top = np.min([right_side_face[0, 1], left_side_face[-1, 1]])
+    extended_forehead_height = int((face_top - eyebrow_top) * 5.0)
+    forehead_left = right_side_face[0].copy()
+    forehead_right = left_side_face[-1].copy()
+    forehead_left[1] -= extended_forehead_height
+    forehead_right[1] -= extended_forehead_height
+    face_outline = np.vstack([[forehead_left], right_side_face, left_side_face[::-1], [forehead_right]])
+    padding = int(np.linalg.norm(right_side_face[0] - left_side_face[-1]) * 0.05)
+    hull = cv2.convexHull(face_outline)
+    hull_padded = []
+    for point in hull:
+        x, y = point[0]
+        center = np.mean(face_outline, axis=0)
+        direction = np.array([x, y]) - center
+        direction = direction / np.linalg.norm(direction)
+        hull_padded.append(np.array([x, y]) + direction * padding)
+    cv2.fillConvexPoly(mask, np.array(hull_padded, dtype=np.int32), 255)
+    return cv2.GaussianBlur(mask, (5, 5), 3)
+
+
+def legacy_create_lower_mouth_mask(face, frame):
+    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+    landmarks = face.landmark_2d_106
+    lower_lip_landmarks = landmarks[[65, 66, 62, 70, 69, 18, 19, 20, 21, 22, 23, 24, 0, 8, 7, 6, 5, 4, 3, 2, 65]].astype(np.float32)
+    center = np.mean(lower_lip_landmarks, axis=0)
+    expanded_landmarks = (lower_lip_landmarks - center) * (1 + modules.globals.mask_down_size) + center
+    for idx in [20, 0, 1, 2, 3, 4, 5]:
+        direction = expanded_landmarks[idx] - center
+        direction = direction / np.linalg.norm(direction)
+        expanded_landmarks[idx] += direction * (modules.globals.mask_size * 0.5)
+    for idx in [11, 12, 13, 14, 15, 16]:
+        expanded_landmarks[idx][1] += (expanded_landmarks[idx][1] - center[1]) * 2 * 0.2
+    expanded_landmarks = expanded_landmarks.astype(np.int32)
+    min_x, min_y = np.min(expanded_landmarks, axis=0)
+    max_x, max_y = np.max(expanded_landmarks, axis=0)
+    padding = int((max_x - min_x) * 0.1)
+    min_x, min_y = max(0, min_x - padding), max(0, min_y - padding)
+    max_x, max_y = min(frame.shape[1], max_x + padding), min(frame.shape[0], max_y + padding)
+    mask_roi = np.zeros((max_y - min_y, max_x - min_x), dtype=np.uint8)
+    cv2.fillPoly(mask_roi, [expanded_landmarks - [min_x, min_y]], 255)
+    mask[min_y:max_y, min_x:max_x] = cv2.GaussianBlur(mask_roi, (15, 15), 5)
+    mouth_cutout = frame[min_y:max_y, min_x:max_x].copy()
+    return mask, mouth_cutout, (min_x, min_y, max_x, max_y), expanded_landmarks
+
+
+def legacy_apply_color_transfer(source, target):
+    source = cv2.cvtColor(source, cv2.COLOR_BGR2LAB).astype("float32")
+    target = cv2.cvtColor(target, cv2.COLOR_BGR2LAB).astype("float32")
+    source_mean, source_std = cv2.meanStdDev(source)
+    target_mean, target_std = cv2.meanStdDev(target)
+    source = (source - source_mean.reshape(1, 1, 3)) * (target_std / source_std).reshape(1, 1, 3) + target_mean.reshape(1, 1, 3)
+    return cv2.cvtColor(np.clip(source, 0, 255).astype("uint8"), cv2.COLOR_LAB2BGR)
+
+
+def legacy_apply_mouth_area(frame, mouth_cutout, mouth_box, face_mask, mouth_polygon):
+    min_x, min_y, max_x, max_y = mouth_box
+    box_width, box_height = max_x - min_x, max_y - min_y
+    roi = frame[min_y:max_y, min_x:max_x]
+    color_corrected_mouth = legacy_apply_color_transfer(cv2.resize(mouth_cutout, (box_width, box_height)), roi)
+    polygon_mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(polygon_mask, [mouth_polygon - [min_x, min_y]], 255)
+    feather_amount = min(30, box_width // modules.globals.mask_feather_ratio, box_height // modules.globals.mask_feather_ratio)
+    feathered_mask = cv2.GaussianBlur(polygon_mask.astype(float), (0, 0), feather_amount)
+    feathered_mask = feathered_mask / feathered_mask.max()
+    face_mask_roi = face_mask[min_y:max_y, min_x:max_x]
+    combined_mask = (feathered_mask * (face_mask_roi / 255.0))[:, :, np.newaxis]
+    blended = (color_corrected_mouth * combined_mask + roi * (1 - combined_mask)).astype(np.uint8)
+    face_mask_3channel = np.repeat(face_mask_roi[:, :, np.newaxis], 3, axis=2) / 255.0
+    frame[min_y:max_y, min_x:max_x] = (blended * face_mask_3channel + roi * (1 - face_mask_3channel)).astype(np.uint8)
+    return frame
+
+
+def legacy_mouth_mask(swapped_frame, face, temp_frame):
+    face_mask = legacy_create_face_mask(face, temp_frame)
+    _, mouth_cutout, mouth_box, lower_lip_polygon = legacy_create_lower_mouth_mask(face, temp_frame)
+    return legacy_apply_mouth_area(swapped_frame, mouth_cutout, mouth_box, face_mask, lower_lip_polygon)
+
+
+def build_masks(face, temp_frame):
+    return create_mouth_masks(get_mouth_mask_geometry(face, temp_frame.shape))
+
+
+def roi_mouth_mask(swapped_frame, face, temp_frame, masks=None):
+    masks = masks or build_masks(face, temp_frame)
+    return apply_mouth_area(swapped_frame, get_mouth_cutout(temp_frame, masks.geometry), masks)
+
+
+def cached_mouth_mask(swapped_frame, face, temp_frame, mask_cache):
+    masks = mask_cache.get(face, temp_frame.shape, lambda face: build_masks(face, temp_frame))
+    return roi_mouth_mask(swapped_frame, face, temp_frame, masks)
+
+
+def make_drifting_faces(face: SyntheticFace, count: int):
+    # A slow pan: one pixel per frame to the right and back
+    offsets = [(step if step <= count // 2 else count - step, 0) for step in range(count)]
+    return [SyntheticFace(face.landmark_2d_106 + offset) for offset in offsets]
+
+
+def measure(function, iterations: int) -> float:
+    function()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--threshold', type=float, default=2)
+    args = parser.parse_args()
+
+    print(f"iterations: {args.iterations}, mask_down_size: {modules.globals.mask_down_size}, mask_size: {modules.globals.mask_size}")
+    print(f"{'resolution':<12}{'legacy ms':>12}{'roi ms':>12}{'speedup':>10}{'max diff':>10}{'reuse ms':>10}{'reused':>8}")
+    for name, (width, height) in RESOLUTIONS.items():
+        face = make_test_face(width, height)
+        temp_frame = make_test_frame(width, height, 0)
+        swapped_frame = make_test_frame(width, height, 1)
+        legacy = measure(lambda: legacy_mouth_mask(swapped_frame.copy(), face, temp_frame), args.iterations)
+        roi = measure(lambda: roi_mouth_mask(swapped_frame.copy(), face, temp_frame), args.iterations)
+        difference = cv2.absdiff(
+            legacy_mouth_mask(swapped_frame.copy(), face, temp_frame), roi_mouth_mask(swapped_frame.copy(), face, temp_frame)
+        ).max()
+        mask_cache = MaskCache(args.threshold)
+        faces = iter(make_drifting_faces(face, args.iterations + 1))
+        reuse = measure(lambda: cached_mouth_mask(swapped_frame.copy(), next(faces), temp_frame, mask_cache), args.iterations)
+        reused = mask_cache.reused / (mask_cache.reused + mask_cache.rebuilt)
+        print(f"{name:<12}{legacy:>12.2f}{roi:>12.2f}{legacy / roi:>9.2f}x{difference:>10}{reuse:>10.2f}{reused:>8.0%}")
+
+
+if __name__ == '__main__':
+    main()
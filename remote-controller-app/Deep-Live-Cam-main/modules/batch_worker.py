@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+class BatchRequest:
+    """Items submitted together by one caller, with their results once the worker ran them."""
+    def __init__(self, items: List[Any]):
+        self.items = items
+        self.results: List[Any] = [None] * len(items)
+        self.error: Optional[BaseException] = None
+        self.remaining = len(items)
+        self.done = threading.Event()
+
+
+class BatchWorker:
+    """
+    Single inference thread fed by many callers.
+    Items submitted from any thread are queued and grouped into micro-batches
+    of up to max_batch_size items; a batch is started as soon as it is full or
+    max_wait seconds after its first item arrived. run_batch gets the items of
+    one batch and returns their results in the same order.
+    """
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 4,
+        max_wait: float = 0.005,
+        name: str = "batch-worker",
+    ):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self.batch_latency = 0.0
+        self.queue_latency = 0.0
+        self._run_batch = run_batch
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, items: List[Any]) -> List[Any]:
+        """Queues items for the worker and blocks until all their results are ready."""
+        if not items:
+            return []
+        request = BatchRequest(items)
+        enqueued = time.monotonic()
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Batch worker is closed")
+            self._queue.extend((request, index, enqueued) for index in range(len(items)))
+            self._condition.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            queued = len(self._queue)
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'queued': queued,
+            'max_batch_size': self.max_batch_size,
+            'occupancy': round(self.items / (self.batches * self.max_batch_size), 3) if self.batches else 0.0,
+            'batch_latency_ms': round(self.batch_latency * 1000, 1),
+            'queue_latency_ms': round(self.queue_latency * 1000, 1),
+        }
+
+    def close(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join(timeout=2.0)
+
+    def _take_batch(self) -> List[Any]:
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue or not self._running)
+            if not self._queue:
+                return []
+            # Hold the first item back for up to max_wait so other threads can join the batch
+            deadline = self._queue[0][2] + self.max_wait
+            while self._running and len(self._queue) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+            count = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+
+            started = time.monotonic()
+            try:
+                results = self._run_batch([request.items[index] for request, index, _ in batch])
+                error = None
+            except Exception as e:
+                results = [None] * len(batch)
+                error = e
+            finished = time.monotonic()
+
+            self.batches += 1
+            self.items += len(batch)
+            self.batch_latency = finished - started
+            self.queue_latency = started - batch[0][2]
+            for (request, index, _), result in zip(batch, results):
+                request.results[index] = result
+                if error is not None:
+                    request.error = error
+                request.remaining -= 1
+                if request.remaining == 0:
+                    request.done.set()
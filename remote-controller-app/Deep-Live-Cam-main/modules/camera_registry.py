@@ -0,0 +1,178 @@
+import glob
+import platform
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+import cv2
+
+# Windows용 웹캠 이름 가져오기
+try:
+    from pygrabber.dshow_graph import FilterGraph
+    FILTERGRAPH_AVAILABLE = True
+except ImportError:
+    FILTERGRAPH_AVAILABLE = False
+
+CAMERA_REGISTRY = None
+THREAD_LOCK = threading.Lock()
+
+
+class CameraInfo:
+    def __init__(self, index: int, name: str, width: int, height: int, fps: int):
+        self.index = index
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'index': self.index,
+            'name': self.name,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+        }
+
+
+class CameraRegistry:
+    """
+    Cached list of the cameras attached to this machine.
+    Devices are probed once on a background thread and then re-probed when
+    /dev/video* changes on Linux, or every refresh_interval seconds on systems
+    without such a signature. Cameras marked as in use are never reopened, so
+    a refresh does not compete with a live capture or the desktop preview.
+    """
+    def __init__(self, max_cameras: int = 10, refresh_interval: float = 60.0, poll_interval: float = 2.0):
+        self.max_cameras = max_cameras
+        self.refresh_interval = refresh_interval
+        self.poll_interval = poll_interval
+        self._cameras: Dict[int, CameraInfo] = {}
+        self._in_use: Set[int] = set()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._probed = threading.Event()
+        self._refresh_requested = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="camera-registry", daemon=True)
+        self._thread.start()
+
+    def cameras(self, timeout: Optional[float] = 30.0) -> List[CameraInfo]:
+        """Returns the cached cameras, waiting for the first probe if it has not finished."""
+        self.start()
+        self._probed.wait(timeout)
+        with self._lock:
+            return [self._cameras[index] for index in sorted(self._cameras)]
+
+    def get(self, index: int) -> Optional[CameraInfo]:
+        return next((camera for camera in self.cameras() if camera.index == index), None)
+
+    def request_refresh(self) -> None:
+        self._refresh_requested.set()
+
+    def mark_in_use(self, index: int, in_use: bool = True) -> None:
+        # Waits for a probe in progress, which may have the device open
+        with self._refresh_lock, self._lock:
+            if in_use:
+                self._in_use.add(index)
+            else:
+                self._in_use.discard(index)
+
+    def refresh(self) -> None:
+        with self._refresh_lock:
+            names = get_camera_names()
+            with self._lock:
+                in_use = set(self._in_use)
+                previous = dict(self._cameras)
+
+            cameras = {}
+            for index in range(self.max_cameras):
+                if index in in_use:
+                    if index in previous:
+                        cameras[index] = previous[index]
+                    continue
+                camera = probe_camera(index, names.get(index))
+                if camera:
+                    cameras[index] = camera
+
+            with self._lock:
+                self._cameras = cameras
+            self._probed.set()
+            print(f"Camera registry: {[camera.to_dict() for camera in cameras.values()]}")
+
+    def _run(self) -> None:
+        signature = get_device_signature()
+        last_refresh = 0.0
+        while True:
+            current_signature = get_device_signature()
+            if (
+                not self._probed.is_set()
+                or self._refresh_requested.is_set()
+                or current_signature != signature
+                or (current_signature is None and time.monotonic() - last_refresh >= self.refresh_interval)
+            ):
+                self._refresh_requested.clear()
+                signature = current_signature
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Camera probe failed: {e}")
+                    self._probed.set()
+                last_refresh = time.monotonic()
+            self._refresh_requested.wait(self.poll_interval)
+
+
+def get_camera_registry() -> CameraRegistry:
+    global CAMERA_REGISTRY
+
+    with THREAD_LOCK:
+        if CAMERA_REGISTRY is None:
+            CAMERA_REGISTRY = CameraRegistry()
+            CAMERA_REGISTRY.start()
+    return CAMERA_REGISTRY
+
+
+def get_device_signature() -> Any:
+    # Only Linux exposes hot-plugged cameras cheaply, other systems rely on the timer
+    if platform.system() == "Linux":
+        return tuple(sorted(glob.glob('/dev/video*')))
+    return None
+
+
+def get_camera_names() -> Dict[int, str]:
+    if platform.system() == "Windows" and FILTERGRAPH_AVAILABLE:
+        try:
+            return dict(enumerate(FilterGraph().get_input_devices()))
+        except Exception as e:
+            print(f"Windows 웹캠 이름 가져오기 실패: {e}")
+    return {}
+
+
+def get_default_camera_name(index: int) -> str:
+    system = platform.system()
+    if system == "Windows":
+        return f"Camera {index}"
+    if system == "Darwin":
+        return "FaceTime HD Camera" if index == 0 else f"Camera {index}"
+    return f"/dev/video{index}"
+
+
+def probe_camera(index: int, name: Optional[str] = None) -> Optional[CameraInfo]:
+    """Opens a camera, checks that it delivers a frame and reads its format."""
+    cap = cv2.VideoCapture(index)
+    try:
+        if not cap.isOpened():
+            return None
+        ret, frame = cap.read()
+        if not ret or frame is None:
+            return None
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        return CameraInfo(index, name or get_default_camera_name(index), width, height, int(fps) if fps > 0 else 30)
+    finally:
+        cap.release()
@@ -0,0 +1,120 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from modules.typing import Frame
+from modules.video_capture import VideoCapturer
+
+
+class CapturePipeline:
+    """
+    Server-side live capture next to the camera.
+    A threaded VideoCapturer reads frames into its ring buffer and a processing
+    thread runs the newest frame through `process`, publishing the encoded
+    result for streaming clients. Frames the processing thread could not keep
+    up with are dropped.
+    """
+    def __init__(
+        self,
+        device_index: int,
+        process: Callable[[Frame], Frame],
+        encode: Callable[[Frame], bytes],
+        width: int = 960,
+        height: int = 540,
+        fps: int = 30,
+        ring_size: int = 4,
+    ):
+        self.device_index = device_index
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.ring_size = ring_size
+        self.processed = 0
+        self.latency = 0.0
+        self._process = process
+        self._encode = encode
+        self._capturer = None
+        self._output_condition = threading.Condition()
+        self._output: Optional[Tuple[int, bytes]] = None
+        self._running = False
+        self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self) -> bool:
+        try:
+            self._capturer = VideoCapturer(self.device_index)
+        except Exception as e:
+            print(f"Failed to open camera {self.device_index}: {e}")
+            return False
+        if not self._capturer.start(self.width, self.height, self.fps, threaded=True, buffer_count=self.ring_size):
+            return False
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="capture-processor", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._running = False
+        with self._output_condition:
+            self._output_condition.notify_all()
+        # The processing thread may still be waiting on or processing a captured frame
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        if self._capturer:
+            self._capturer.release()
+
+    def wait_for_frame(self, last_sequence: int, timeout: float = 5.0) -> Optional[Tuple[int, bytes]]:
+        """Waits for an encoded frame newer than last_sequence and returns (sequence, data)."""
+        with self._output_condition:
+            self._output_condition.wait_for(
+                lambda: not self._running or (self._output is not None and self._output[0] > last_sequence),
+                timeout,
+            )
+            if self._output is not None and self._output[0] > last_sequence:
+                return self._output
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        capturer = self._capturer
+        return {
+            'camera_index': self.device_index,
+            'running': self._running,
+            'captured': capturer.frames_captured if capturer else 0,
+            'processed': self.processed,
+            'dropped': capturer.frames_dropped if capturer else 0,
+            'latency_ms': round(self.latency * 1000, 1),
+        }
+
+    def _run(self) -> None:
+        sequence = 0
+        last_capture = 0
+        while self._running:
+            captured = self._capturer.wait_for_frame(last_capture)
+            if captured is None:
+                if not self._capturer.is_running:
+                    print(f"Camera {self.device_index} stopped delivering frames.")
+                    break
+                continue
+            last_capture = captured.sequence
+
+            try:
+                data = self._encode(self._process(captured.frame))
+            except Exception as e:
+                print(f"Error processing captured frame: {e}")
+                continue
+
+            sequence += 1
+            self.processed += 1
+            self.latency = time.monotonic() - captured.timestamp
+            with self._output_condition:
+                self._output = (sequence, data)
+                self._output_condition.notify_all()
+
+        self._running = False
+        with self._output_condition:
+            self._output_condition.notify_all()
@@ -11,6 +11,7 @@ import platform
 import signal
 import shutil
 import argparse
+import json
 import torch
 import onnxruntime
 import tensorflow
@@ -21,7 +22,8 @@ import urllib
 import modules.globals
 import modules.metadata
 # import modules.ui as ui
-from modules.processors.frame.core import get_frame_processors_modules
+from modules.processors.frame.core import get_frame_processors_modules, process_video_fused, process_video_stream
+from modules.onnx_session import print_session_config
 from modules.utilities import has_image_extension, is_image, is_video, detect_fps, create_video, extract_frames, get_temp_frame_paths, restore_audio, create_temp, move_temp, clean_temp, normalize_output_path
 
 if 'ROCMExecutionProvider' in modules.globals.execution_providers:
@@ -46,6 +48,10 @@ def parse_args() -> None:
     program.add_argument('--nsfw-filter', help='filter the NSFW image or video', dest='nsfw_filter', action='store_true', default=False)
     program.add_argument('--map-faces', help='map source target faces', dest='map_faces', action='store_true', default=False)
     program.add_argument('--mouth-mask', help='mask the mouth region', dest='mouth_mask', action='store_true', default=False)
+    program.add_argument('--mask-reuse-threshold', help='reuse the mouth masks of earlier live frames while face landmarks deform less than n pixels, 0 rebuilds them every frame', dest='mask_reuse_threshold', type=float, default=0)
+    program.add_argument('--face-tracking', help='track faces between detections in live mode', dest='face_tracking', action='store_true', default=False)
+    program.add_argument('--face-tracking-interval', help='run full face detection every n live frames', dest='face_tracking_interval', type=int, default=5)
+    program.add_argument('--adaptive-detection', help='pick the face detection size from the last face size in live mode', dest='adaptive_detection', action='store_true', default=False)
     program.add_argument('--video-encoder', help='adjust output video encoder', dest='video_encoder', default='libx264', choices=['libx264', 'libx265', 'libvpx-vp9'])
     program.add_argument('--video-quality', help='adjust output video quality', dest='video_quality', type=int, default=18, choices=range(52), metavar='[0-51]')
     program.add_argument('-l', '--lang', help='Ui language', default="en")
@@ -54,6 +60,15 @@ def parse_args() -> None:
     program.add_argument('--max-memory', help='maximum amount of RAM in GB', dest='max_memory', type=int, default=suggest_max_memory())
     program.add_argument('--execution-provider', help='execution provider', dest='execution_provider', default=['cpu'], choices=suggest_execution_providers(), nargs='+')
     program.add_argument('--execution-threads', help='number of execution threads', dest='execution_threads', type=int, default=suggest_execution_threads())
+    program.add_argument('--batch-size', help='number of video frames swapped per inference', dest='batch_size', type=int, default=1)
+    program.add_argument('--enhancer-batch-size', help='maximum number of face crops enhanced per inference', dest='enhancer_batch_size', type=int, default=4)
+    program.add_argument('--enhancer-batch-wait', help='milliseconds the enhancer waits to fill a batch', dest='enhancer_batch_wait', type=float, default=5)
+    program.add_argument('--enhancer-backend', help='runtime of the face enhancer model', dest='enhancer_backend', default='torch', choices=['torch', 'onnx'])
+    program.add_argument('--ort-intra-op-threads', help='threads per onnxruntime operator, 0 lets onnxruntime decide', dest='ort_intra_op_threads', type=int, default=0)
+    program.add_argument('--ort-inter-op-threads', help='threads running independent onnxruntime operators, 0 lets onnxruntime decide', dest='ort_inter_op_threads', type=int, default=0)
+    program.add_argument('--ort-graph-optimization', help='onnxruntime graph optimization level', dest='ort_graph_optimization', default='all', choices=['disabled', 'basic', 'extended', 'all'])
+    program.add_argument('--ort-cache-dir', help='directory caching optimized onnx models', dest='ort_cache_dir', default=None)
+    program.add_argument('--ort-provider-options', help='JSON object of options per execution provider', dest='ort_provider_options', type=json.loads, default={})
     program.add_argument('-v', '--version', action='version', version=f'{modules.metadata.name} {modules.metadata.version}')
 
     # register deprecated args
@@ -74,6 +89,10 @@ def parse_args() -> None:
     modules.globals.keep_frames = args.keep_frames
     modules.globals.many_faces = args.many_faces
     modules.globals.mouth_mask = args.mouth_mask
+    modules.globals.mask_reuse_threshold = args.mask_reuse_threshold
+    modules.globals.face_tracking = args.face_tracking
+    modules.globals.face_tracking_interval = args.face_tracking_interval
+    modules.globals.adaptive_detection = args.adaptive_detection
     modules.globals.nsfw_filter = args.nsfw_filter
     modules.globals.map_faces = args.map_faces
     modules.globals.video_encoder = args.video_encoder
@@ -83,6 +102,15 @@ def parse_args() -> None:
     modules.globals.max_memory = args.max_memory
     modules.globals.execution_providers = decode_execution_providers(args.execution_provider)
     modules.globals.execution_threads = args.execution_threads
+    modules.globals.batch_size = args.batch_size
+    modules.globals.enhancer_batch_size = args.enhancer_batch_size
+    modules.globals.enhancer_batch_wait = args.enhancer_batch_wait
+    modules.globals.enhancer_backend = args.enhancer_backend
+    modules.globals.ort_intra_op_threads = args.ort_intra_op_threads
+    modules.globals.ort_inter_op_threads = args.ort_inter_op_threads
+    modules.globals.ort_graph_optimization = args.ort_graph_optimization
+    modules.globals.ort_cache_dir = args.ort_cache_dir
+    modules.globals.ort_provider_options = args.ort_provider_options
     modules.globals.lang = args.lang
 
     #for ENHANCER tumbler:
@@ -205,26 +233,49 @@ def start() -> None:
     if modules.globals.nsfw_filter and ui.check_and_ignore_nsfw(modules.globals.target_path, destroy):
         return
 
-    if not modules.globals.map_faces:
+    # stream frames through ffmpeg pipes unless temp frames are needed
+    streamed = False
+    if not modules.globals.keep_frames and not modules.globals.map_faces:
+        fps = 30.0
+        if modules.globals.keep_fps:
+            update_status('Detecting fps...')
+            fps = detect_fps(modules.globals.target_path)
         update_status('Creating temp resources...')
         create_temp(modules.globals.target_path)
-        update_status('Extracting frames...')
-        extract_frames(modules.globals.target_path)
-
-    temp_frame_paths = get_temp_frame_paths(modules.globals.target_path)
-    for frame_processor in get_frame_processors_modules(modules.globals.frame_processors):
-        update_status('Progressing...', frame_processor.NAME)
-        frame_processor.process_video(modules.globals.source_path, temp_frame_paths)
+        update_status(f'Processing frames in memory with {fps} fps...')
+        streamed = process_video_stream(modules.globals.source_path, modules.globals.target_path, fps)
         release_resources()
-    # handles fps
-    if modules.globals.keep_fps:
-        update_status('Detecting fps...')
-        fps = detect_fps(modules.globals.target_path)
-        update_status(f'Creating video with {fps} fps...')
-        create_video(modules.globals.target_path, fps)
-    else:
-        update_status('Creating video with 30.0 fps...')
-        create_video(modules.globals.target_path)
+        if not streamed:
+            update_status('In-memory processing failed, falling back to temp frames...')
+
+    if not streamed:
+        if not modules.globals.map_faces:
+            update_status('Creating temp resources...')
+            create_temp(modules.globals.target_path)
+            update_status('Extracting frames...')
+            extract_frames(modules.globals.target_path)
+
+        temp_frame_paths = get_temp_frame_paths(modules.globals.target_path)
+        frame_processors = get_frame_processors_modules(modules.globals.frame_processors)
+        if len(frame_processors) > 1:
+            # one read and one write per frame for the whole chain
+            update_status('Progressing...', ' + '.join(frame_processor.NAME for frame_processor in frame_processors))
+            process_video_fused(modules.globals.source_path, temp_frame_paths)
+            release_resources()
+        else:
+            for frame_processor in frame_processors:
+                update_status('Progressing...', frame_processor.NAME)
+                frame_processor.process_video(modules.globals.source_path, temp_frame_paths)
+                release_resources()
+        # handles fps
+        if modules.globals.keep_fps:
+            update_status('Detecting fps...')
+            fps = detect_fps(modules.globals.target_path)
+            update_status(f'Creating video with {fps} fps...')
+            create_video(modules.globals.target_path, fps)
+        else:
+            update_status('Creating video with 30.0 fps...')
+            create_video(modules.globals.target_path)
     # handle audio
     if modules.globals.keep_audio:
         if modules.globals.keep_fps:
@@ -252,6 +303,7 @@ def run() -> None:
     parse_args()
     if not pre_check():
         return
+    print_session_config()
     for frame_processor in get_frame_processors_modules(modules.globals.frame_processors):
         if not frame_processor.pre_check():
             return
@@ -1,6 +1,8 @@
+import copy
 import os
 import shutil
-from typing import Any
+import threading
+from typing import Any, Dict, Tuple
 import insightface
 
 import cv2
@@ -8,33 +10,129 @@ import numpy as np
 import modules.globals
 from tqdm import tqdm
 from modules.typing import Frame
+from modules.onnx_session import load_model
 from modules.cluster_analysis import find_cluster_centroids, find_closest_centroid
 from modules.utilities import get_temp_directory_path, create_temp, extract_frames, clean_temp, get_temp_frame_paths
 from pathlib import Path
 
 FACE_ANALYSER = None
-
-
-def get_face_analyser() -> Any:
+FACE_ANALYSERS: Dict[Tuple[str, int], Any] = {}
+THREAD_LOCK = threading.Lock()
+
+# buffalo_l sub-models each profile runs, None runs all of them
+ANALYSER_PROFILES = {
+    'full': None,
+    'detection': ['detection'],
+    'landmark': ['detection', 'landmark_2d_106'],
+    'embedding': ['detection', 'recognition'],
+    'embedding_landmark': ['detection', 'landmark_2d_106', 'recognition'],
+}
+
+# Adaptive detection picks the smallest size at which the last face stays easy to detect
+DETECTION_SIZES = (320, 480, 640)
+DETECTION_SIZE_FACE_RATIOS = {320: 0.3, 480: 0.15}
+DETECTION_SIZE_USAGE: Dict[int, int] = {size: 0 for size in DETECTION_SIZES}
+DETECTION_SIZE_USAGE_LOCK = threading.Lock()
+DETECTION_STATE = threading.local()
+
+
+def create_face_analyser(allowed_modules: Any = None) -> Any:
+    """FaceAnalysis over buffalo_l, with its models on the shared sessions of the session factory."""
+    face_analyser = insightface.app.FaceAnalysis(
+        name='buffalo_l', allowed_modules=allowed_modules, providers=modules.globals.execution_providers
+    )
+    # Swap each model for one on the shared session of its file
+    for taskname, model in face_analyser.models.items():
+        face_analyser.models[taskname] = load_model(model.model_file)
+    face_analyser.det_model = face_analyser.models['detection']
+    return face_analyser
+
+
+def get_face_analyser(profile: str = 'full', det_size: int = 640) -> Any:
     global FACE_ANALYSER
 
-    if FACE_ANALYSER is None:
-        FACE_ANALYSER = insightface.app.FaceAnalysis(name='buffalo_l', providers=modules.globals.execution_providers)
-        FACE_ANALYSER.prepare(ctx_id=0, det_size=(640, 640))
-    return FACE_ANALYSER
-
-
-def get_one_face(frame: Frame) -> Any:
-    face = get_face_analyser().get(frame)
+    with THREAD_LOCK:
+        if (profile, det_size) not in FACE_ANALYSERS:
+            if (profile, 640) not in FACE_ANALYSERS:
+                face_analyser = create_face_analyser(ANALYSER_PROFILES[profile])
+                face_analyser.prepare(ctx_id=0, det_size=(640, 640))
+                FACE_ANALYSERS[(profile, 640)] = face_analyser
+                if profile == 'full':
+                    FACE_ANALYSER = face_analyser
+            if det_size != 640:
+                # Smaller sizes share the loaded sessions, only the detector input size differs
+                face_analyser = copy.copy(FACE_ANALYSERS[(profile, 640)])
+                face_analyser.det_model = copy.copy(face_analyser.det_model)
+                # RetinaFace.prepare keeps an input size that is already set, so it is assigned directly
+                face_analyser.det_model.input_size = (det_size, det_size)
+                face_analyser.det_size = (det_size, det_size)
+                FACE_ANALYSERS[(profile, det_size)] = face_analyser
+    return FACE_ANALYSERS[(profile, det_size)]
+
+
+def get_swap_profile(embedding: bool = False) -> str:
+    # The swapper only needs kps, the mouth mask adds landmark_2d_106
+    if modules.globals.mouth_mask:
+        return 'embedding_landmark' if embedding else 'landmark'
+    return 'embedding' if embedding else 'detection'
+
+
+def pick_detection_size() -> int:
+    face_ratio = getattr(DETECTION_STATE, 'face_ratio', None)
+    if face_ratio is not None:
+        for size in DETECTION_SIZES[:-1]:
+            if face_ratio >= DETECTION_SIZE_FACE_RATIOS[size]:
+                return size
+    return DETECTION_SIZES[-1]
+
+
+def detect_faces_adaptive(frame: Frame, profile: str) -> Any:
+    """
+    Detects faces at a size picked from the previous frame's largest face on this
+    thread, retrying at full size when the smaller detector finds nothing.
+    """
+    det_size = pick_detection_size()
+    faces = get_face_analyser(profile, det_size).get(frame)
+    if not faces and det_size != DETECTION_SIZES[-1]:
+        det_size = DETECTION_SIZES[-1]
+        faces = get_face_analyser(profile, det_size).get(frame)
+
+    DETECTION_STATE.det_size = det_size
+    with DETECTION_SIZE_USAGE_LOCK:
+        DETECTION_SIZE_USAGE[det_size] += 1
+    if faces:
+        face_height = max(face.bbox[3] - face.bbox[1] for face in faces)
+        DETECTION_STATE.face_ratio = face_height / max(frame.shape[:2])
+    else:
+        DETECTION_STATE.face_ratio = None
+    return faces
+
+
+def get_last_detection_size() -> Any:
+    return getattr(DETECTION_STATE, 'det_size', None)
+
+
+def get_detection_size_usage() -> Dict[int, int]:
+    with DETECTION_SIZE_USAGE_LOCK:
+        return dict(DETECTION_SIZE_USAGE)
+
+
+def get_one_face(frame: Frame, profile: str = 'full', adaptive: bool = False) -> Any:
+    if adaptive:
+        face = detect_faces_adaptive(frame, profile)
+    else:
+        face = get_face_analyser(profile).get(frame)
     try:
         return min(face, key=lambda x: x.bbox[0])
     except ValueError:
         return None
 
 
-def get_many_faces(frame: Frame) -> Any:
+def get_many_faces(frame: Frame, profile: str = 'full', adaptive: bool = False) -> Any:
     try:
-        return get_face_analyser().get(frame)
+        if adaptive:
+            return detect_faces_adaptive(frame, profile)
+        return get_face_analyser(profile).get(frame)
     except IndexError:
         return None
 
@@ -77,7 +175,7 @@ def get_unique_faces_from_target_image() -> Any:
     try:
         modules.globals.source_target_map = []
         target_frame = cv2.imread(modules.globals.target_path)
-        many_faces = get_many_faces(target_frame)
+        many_faces = get_many_faces(target_frame, get_swap_profile(embedding=True))
         i = 0
 
         for face in many_faces:
@@ -111,7 +209,7 @@ def get_unique_faces_from_target_video() -> Any:
         i = 0
         for temp_frame_path in tqdm(temp_frame_paths, desc="Extracting face embeddings from frames"):
             temp_frame = cv2.imread(temp_frame_path)
-            many_faces = get_many_faces(temp_frame)
+            many_faces = get_many_faces(temp_frame, get_swap_profile(embedding=True))
 
             for face in many_faces:
                 face_embeddings.append(face.normed_embedding)
@@ -0,0 +1,98 @@
+from typing import Callable, List, Optional
+
+import cv2
+import numpy as np
+
+from modules.typing import Face, Frame
+
+LK_PARAMS = dict(
+    winSize=(21, 21),
+    maxLevel=3,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03),
+)
+
+
+class FaceTracker:
+    """
+    Detection-skip tracker for live video.
+    Full detection runs every detection_interval frames; in between, the
+    5-point kps of the last faces are followed with pyramidal Lucas-Kanade
+    optical flow and a similarity transform fitted to them moves bbox, kps and
+    landmark_2d_106. Detection also runs as soon as tracking confidence drops:
+    a lost point, a poor transform fit, or a new frame size.
+    """
+    def __init__(self, detection_interval: int = 5, max_residual: float = 0.03):
+        self.detection_interval = detection_interval
+        self.max_residual = max_residual
+        self.detections = 0
+        self.tracked = 0
+        self._faces: List[Face] = []
+        self._previous_gray: Optional[np.ndarray] = None
+        self._frames_since_detection = 0
+
+    def reset(self) -> None:
+        self._faces = []
+        self._previous_gray = None
+        self._frames_since_detection = 0
+
+    def update(self, frame: Frame, detect: Callable[[Frame], List[Face]]) -> List[Face]:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = None
+        if (
+            self._faces
+            and self._previous_gray is not None
+            and self._previous_gray.shape == gray.shape
+            and self._frames_since_detection < self.detection_interval - 1
+        ):
+            faces = self._track(gray)
+
+        if faces is None:
+            faces = detect(frame) or []
+            self._frames_since_detection = 0
+            self.detections += 1
+        else:
+            self._frames_since_detection += 1
+            self.tracked += 1
+
+        self._faces = faces
+        self._previous_gray = gray
+        return faces
+
+    def _track(self, gray: np.ndarray) -> Optional[List[Face]]:
+        points = np.concatenate([face.kps for face in self._faces]).astype(np.float32).reshape(-1, 1, 2)
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(self._previous_gray, gray, points, None, **LK_PARAMS)
+        if new_points is None or not status.all():
+            return None
+
+        tracked = []
+        for i, face in enumerate(self._faces):
+            old_kps = points[i * 5:(i + 1) * 5].reshape(-1, 2)
+            new_kps = new_points[i * 5:(i + 1) * 5].reshape(-1, 2)
+            matrix, _ = cv2.estimateAffinePartial2D(old_kps, new_kps)
+            if matrix is None:
+                return None
+
+            # A poor similarity fit means the face turned or the flow is off
+            face_size = max(face.bbox[2] - face.bbox[0], face.bbox[3] - face.bbox[1], 1.0)
+            residual = np.linalg.norm(transform_points(old_kps, matrix) - new_kps, axis=1).mean()
+            if residual > self.max_residual * face_size:
+                return None
+            tracked.append(transform_face(face, matrix, new_kps))
+        return tracked
+
+
+def transform_points(points: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    return cv2.transform(points.reshape(-1, 1, 2).astype(np.float32), matrix).reshape(-1, 2)
+
+
+def transform_face(face: Face, matrix: np.ndarray, kps: np.ndarray) -> Face:
+    """Returns a copy of face moved by a 2x3 similarity transform."""
+    moved = Face(face)
+    x1, y1, x2, y2 = face.bbox
+    corners = transform_points(np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]]), matrix)
+    moved.bbox = np.concatenate([corners.min(axis=0), corners.max(axis=0)]).astype(np.float32)
+    moved.kps = kps.astype(np.float32)
+    if face.landmark_2d_106 is not None:
+        moved.landmark_2d_106 = transform_points(face.landmark_2d_106, matrix)
+    return moved
+
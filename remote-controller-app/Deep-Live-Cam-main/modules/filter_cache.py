@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import cv2
+
+from modules.face_analyser import get_one_face
+from modules.typing import Face, Frame
+
+
+class FilterEntry:
+    """A decoded filter image with the face extracted from it."""
+    def __init__(self, path: str, mtime_ns: int, image: Frame, face: Optional[Face]):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.image = image
+        self.face = face
+        self.embedding = face.normed_embedding if face is not None else None
+        self.nbytes = image.nbytes + (self.embedding.nbytes if self.embedding is not None else 0)
+
+
+class FilterCache:
+    """
+    LRU cache of filter images and their source faces, keyed by path and mtime.
+    An entry is reloaded when its file changes on disk, and the least recently
+    used entries are evicted once max_entries or max_bytes is exceeded.
+    """
+    def __init__(self, max_entries: int = 16, max_bytes: int = 256 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, FilterEntry]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[FilterEntry]:
+        """Returns the entry for a filter image, or None if it cannot be read."""
+        key = os.path.abspath(path)
+        try:
+            mtime_ns = os.stat(key).st_mtime_ns
+        except OSError:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == mtime_ns:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Load outside the lock so a slow face analysis does not block other filters
+        image = cv2.imread(key)
+        if image is None:
+            self.invalidate(key)
+            return None
+        entry = FilterEntry(key, mtime_ns, image, get_one_face(image))
+        self.put(entry)
+        return entry
+
+    def put(self, entry: FilterEntry) -> None:
+        with self._lock:
+            self._remove(entry.path)
+            self._entries[entry.path] = entry
+            self._nbytes += entry.nbytes
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._nbytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            self._remove(os.path.abspath(path))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> Any:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._nbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._nbytes -= entry.nbytes
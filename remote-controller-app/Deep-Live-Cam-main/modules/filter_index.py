@@ -0,0 +1,167 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from modules.face_analyser import get_one_face
+from modules.typing import Face
+
+INDEX_FILE = ".filter_index.npz"
+# Lookup order matches the .png-then-.jpg probing of the API server
+FILTER_EXTENSIONS = (".png", ".jpg")
+
+
+class FilterIndexEntry:
+    def __init__(self, path: str, mtime_ns: int, face: Optional[Face]):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.face = face
+
+
+class FilterIndex:
+    """
+    Precomputed source faces for every filter image in a media directory.
+    A background thread analyses each filter once, persists bbox, kps,
+    landmarks and embedding to an npz file next to the images, and polls the
+    directory so added, changed and removed filters are picked up live.
+    """
+    def __init__(self, media_dir: str, poll_interval: float = 5.0):
+        self.media_dir = media_dir
+        self.index_path = os.path.join(media_dir, INDEX_FILE)
+        self.poll_interval = poll_interval
+        self.ready = False
+        self._entries: Dict[str, FilterIndexEntry] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.load()
+        self._thread = threading.Thread(target=self._run, name="filter-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def find(self, name: str) -> Optional[str]:
+        """Returns the path of the filter called name, or None if it is not indexed."""
+        with self._lock:
+            for extension in FILTER_EXTENSIONS:
+                path = os.path.join(self.media_dir, f"{name}{extension}")
+                if path in self._entries:
+                    return path
+        return None
+
+    def get(self, path: str) -> Optional[FilterIndexEntry]:
+        """Returns the entry of a filter if it is indexed and unchanged on disk."""
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        try:
+            if os.stat(path).st_mtime_ns != entry.mtime_ns:
+                return None
+        except OSError:
+            return None
+        return entry
+
+    def refresh(self) -> bool:
+        """Re-analyses new or changed filters and drops removed ones. Returns True on changes."""
+        try:
+            files = {
+                os.path.join(self.media_dir, file.name): file.stat().st_mtime_ns
+                for file in os.scandir(self.media_dir)
+                if file.is_file() and file.name.lower().endswith(FILTER_EXTENSIONS)
+            }
+        except OSError:
+            files = {}
+
+        with self._lock:
+            removed = [path for path in self._entries if path not in files]
+            for path in removed:
+                del self._entries[path]
+            stale = [
+                path for path, mtime_ns in files.items()
+                if path not in self._entries or self._entries[path].mtime_ns != mtime_ns
+            ]
+
+        for path in stale:
+            image = cv2.imread(path)
+            face = get_one_face(image) if image is not None else None
+            with self._lock:
+                self._entries[path] = FilterIndexEntry(path, files[path], face)
+            print(f"Indexed filter {path}: {'face found' if face else 'no face'}")
+
+        self.ready = True
+        return bool(removed or stale)
+
+    def load(self) -> None:
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with np.load(self.index_path, allow_pickle=False) as data:
+                entries = {}
+                for i, path in enumerate(data["paths"]):
+                    face = None
+                    if data["has_face"][i]:
+                        face = Face(
+                            bbox=data["bbox"][i],
+                            kps=data["kps"][i],
+                            det_score=float(data["det_score"][i]),
+                            landmark_2d_106=data["landmark_2d_106"][i],
+                            embedding=data["normed_embedding"][i],
+                        )
+                    entries[str(path)] = FilterIndexEntry(str(path), int(data["mtime_ns"][i]), face)
+        except Exception as e:
+            print(f"Could not load filter index {self.index_path}: {e}")
+            return
+        with self._lock:
+            self._entries = entries
+        print(f"Loaded {len(entries)} filters from {self.index_path}")
+
+    def save(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+        count = len(entries)
+        arrays: Dict[str, Any] = {
+            "paths": np.array([entry.path for entry in entries], dtype=str),
+            "mtime_ns": np.array([entry.mtime_ns for entry in entries], dtype=np.int64),
+            "has_face": np.zeros(count, dtype=bool),
+            "bbox": np.zeros((count, 4), dtype=np.float32),
+            "kps": np.zeros((count, 5, 2), dtype=np.float32),
+            "det_score": np.zeros(count, dtype=np.float32),
+            "landmark_2d_106": np.zeros((count, 106, 2), dtype=np.float32),
+            "normed_embedding": np.zeros((count, 512), dtype=np.float32),
+        }
+        for i, entry in enumerate(entries):
+            face = entry.face
+            if face is None:
+                continue
+            arrays["has_face"][i] = True
+            arrays["bbox"][i] = face.bbox
+            arrays["kps"][i] = face.kps
+            arrays["det_score"][i] = face.det_score
+            if face.landmark_2d_106 is not None:
+                arrays["landmark_2d_106"][i] = face.landmark_2d_106
+            arrays["normed_embedding"][i] = face.normed_embedding
+
+        temp_path = self.index_path + ".tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Could not save filter index {self.index_path}: {e}")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                if self.refresh():
+                    self.save()
+            except Exception as e:
+                print(f"Filter indexing failed: {e}")
+            self._stop_event.wait(self.poll_interval)
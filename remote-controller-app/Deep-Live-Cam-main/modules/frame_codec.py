@@ -0,0 +1,51 @@
+from typing import Any, Optional
+import cv2
+import numpy as np
+
+from modules.typing import Frame
+
+# libjpeg-turbo is optional, OpenCV is used when it is not installed
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    TURBOJPEG = TurboJPEG()
+except Exception:
+    TURBOJPEG = None
+
+JPEG_MAGIC = b'\xff\xd8'
+DEFAULT_JPEG_QUALITY = 85
+DECODE_SCALES = (1, 2, 4, 8)
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def get_backend_name() -> str:
+    return 'turbojpeg' if TURBOJPEG is not None else 'opencv'
+
+
+def decode_image(buffer: Any, scale: int = 1) -> Optional[Frame]:
+    """
+    Decodes an encoded image straight to a BGR frame.
+    The buffer (bytes, bytearray or memoryview) is wrapped without copying.
+    A scale of 2, 4 or 8 decodes at 1/scale of the original resolution.
+    """
+    if scale not in DECODE_SCALES:
+        raise ValueError(f"Unsupported decode scale {scale}. Use one of {DECODE_SCALES}")
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if TURBOJPEG is not None and data[:2].tobytes() == JPEG_MAGIC:
+        try:
+            return TURBOJPEG.decode(data, pixel_format=TJPF_BGR, scaling_factor=(1, scale))
+        except Exception:
+            # Fall back to OpenCV for JPEG variants TurboJPEG rejects
+            pass
+    return cv2.imdecode(data, REDUCED_COLOR_FLAGS[scale])
+
+
+def encode_jpeg(frame: Frame, quality: int = DEFAULT_JPEG_QUALITY) -> bytes:
+    if TURBOJPEG is not None:
+        return TURBOJPEG.encode(frame, quality=quality, pixel_format=TJPF_BGR)
+    _, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes()
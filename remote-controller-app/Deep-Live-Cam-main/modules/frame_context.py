@@ -0,0 +1,16 @@
+from typing import List, Optional
+
+from modules.typing import Face
+
+
+class FrameContext:
+    """
+    Per-frame state shared by the processors of one pass over a frame.
+    The face swapper stores the target faces it found so later processors
+    reuse them instead of running their own detection. live marks frames of
+    a live stream, which arrive in order on one thread and may be tracked.
+    """
+    def __init__(self, frame_path: str = "", live: bool = False):
+        self.frame_path = frame_path
+        self.live = live
+        self.target_faces: Optional[List[Face]] = None
@@ -41,3 +41,16 @@ show_mouth_mask_box = False
 mask_feather_ratio = 8
 mask_down_size = 0.50
 mask_size = 1
+mask_reuse_threshold = 0
+face_tracking = False
+face_tracking_interval = 5
+adaptive_detection = False
+batch_size = 1
+enhancer_batch_size = 4
+enhancer_batch_wait = 5
+enhancer_backend = 'torch'
+ort_intra_op_threads = 0
+ort_inter_op_threads = 0
+ort_graph_optimization = 'all'
+ort_cache_dir = None
+ort_provider_options = {}
@@ -0,0 +1,82 @@
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import modules.globals
+from modules.mouth_mask import MouthMasks
+from modules.typing import Face
+
+
+class MaskCacheEntry:
+    def __init__(self, landmarks: np.ndarray, key: Tuple, masks: Optional[MouthMasks]):
+        self.landmarks = landmarks
+        self.key = key
+        self.masks = masks
+
+
+class MaskCache:
+    """
+    Temporal reuse of mouth masks for live video.
+    The masks of a face depend only on its 106 landmarks and the mask settings,
+    so while the face moves rigidly they are the previous masks shifted. Each
+    entry keeps the landmarks its masks were built from; a face whose landmarks,
+    once the mean shift is taken out, stay within threshold pixels of an entry
+    reuses that entry's masks moved by the shift. Larger motion, a mouth that
+    opens or closes, changed mask settings or a new frame size rebuild them.
+    """
+    def __init__(self, threshold: float = 2.0, max_entries: int = 8):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.reused = 0
+        self.rebuilt = 0
+        self._entries: List[MaskCacheEntry] = []
+
+    def reset(self) -> None:
+        self._entries = []
+
+    def get(self, face: Face, frame_shape: Tuple[int, ...], build: Callable[[Face], Optional[MouthMasks]]) -> Optional[MouthMasks]:
+        landmarks = face.landmark_2d_106
+        if landmarks is None:
+            return None
+        key = (
+            frame_shape[:2],
+            modules.globals.mask_down_size,
+            modules.globals.mask_size,
+            modules.globals.mask_feather_ratio,
+        )
+
+        best_entry, best_residual, best_shift = None, self.threshold, None
+        for entry in self._entries:
+            if entry.key != key:
+                continue
+            displacement = landmarks - entry.landmarks
+            shift = displacement.mean(axis=0)
+            residual = np.sqrt(((displacement - shift) ** 2).sum(axis=1).max())
+            if residual <= best_residual:
+                best_entry, best_residual, best_shift = entry, residual, shift
+
+        if best_entry is not None:
+            masks = self._shift(best_entry.masks, best_shift, frame_shape)
+            if masks is not None or best_entry.masks is None:
+                # Most recently used first, so the face's own entry is found early
+                self._entries.remove(best_entry)
+                self._entries.insert(0, best_entry)
+                self.reused += 1
+                return masks
+
+        masks = build(face)
+        self._entries.insert(0, MaskCacheEntry(np.array(landmarks, dtype=np.float32), key, masks))
+        del self._entries[self.max_entries:]
+        self.rebuilt += 1
+        return masks
+
+    @staticmethod
+    def _shift(masks: Optional[MouthMasks], shift: np.ndarray, frame_shape: Tuple[int, ...]) -> Optional[MouthMasks]:
+        if masks is None:
+            return None
+        dx, dy = (int(value) for value in np.rint(shift))
+        min_x, min_y, max_x, max_y = masks.geometry.mouth_box
+        # Masks that would leave the frame are rebuilt, their clipped edges differ
+        if min_x + dx < 0 or min_y + dy < 0 or max_x + dx > frame_shape[1] or max_y + dy > frame_shape[0]:
+            return None
+        return masks.shifted(dx, dy) if dx or dy else masks
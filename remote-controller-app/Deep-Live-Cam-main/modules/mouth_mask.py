@@ -0,0 +1,233 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+import modules.globals
+from modules.scratch_buffers import get_scratch
+from modules.typing import Face, Frame
+
+# landmark_2d_106 points outlining the lower lip and chin, closed back to 65
+LOWER_LIP_ORDER = [65, 66, 62, 70, 69, 18, 19, 20, 21, 22, 23, 24, 0, 8, 7, 6, 5, 4, 3, 2, 65]
+# Positions in LOWER_LIP_ORDER pushed outwards along the top lip and downwards at the chin
+TOPLIP_INDICES = [20, 0, 1, 2, 3, 4, 5]
+CHIN_INDICES = [11, 12, 13, 14, 15, 16]
+CHIN_EXTENSION = 0.4
+# Kernel radius of the face mask blur, kept as zero margin around the face box
+FACE_MASK_BLUR_RADIUS = 2
+# Wide feathers are blurred on a mask downscaled so the sigma is about this many pixels
+FEATHER_SIGMA = 8
+
+Box = Tuple[int, int, int, int]
+
+
+class MouthMaskGeometry:
+    """
+    Face hull and lower-mouth polygon of one face in frame coordinates, with
+    the boxes the masks are rasterised in. Built once per face and shared by
+    the face mask, the mouth blend and the visualisation.
+    """
+    def __init__(self, face_hull: np.ndarray, face_box: Box, mouth_polygon: np.ndarray, mouth_box: Box):
+        self.face_hull = face_hull
+        self.face_box = face_box
+        self.mouth_polygon = mouth_polygon
+        self.mouth_box = mouth_box
+
+    def shifted(self, dx: int, dy: int) -> "MouthMaskGeometry":
+        x1, y1, x2, y2 = self.face_box
+        min_x, min_y, max_x, max_y = self.mouth_box
+        return MouthMaskGeometry(
+            self.face_hull + (dx, dy), (x1 + dx, y1 + dy, x2 + dx, y2 + dy),
+            self.mouth_polygon + (dx, dy), (min_x + dx, min_y + dy, max_x + dx, max_y + dy),
+        )
+
+
+class MouthMasks:
+    """
+    Float32 blend masks of one face over its mouth box: the feathered mouth
+    mask limited to the face, and the face coverage. They depend only on the
+    geometry and the mask settings, not on frame content, so they can be
+    reused for a later frame in which the face has only moved.
+    """
+    def __init__(self, geometry: MouthMaskGeometry, mouth_mask: np.ndarray, face_mask: np.ndarray):
+        self.geometry = geometry
+        self.mouth_mask = mouth_mask
+        self.face_mask = face_mask
+
+    def shifted(self, dx: int, dy: int) -> "MouthMasks":
+        return MouthMasks(self.geometry.shifted(dx, dy), self.mouth_mask, self.face_mask)
+
+
+def get_mouth_mask_geometry(face: Face, frame_shape: Tuple[int, ...]) -> Optional[MouthMaskGeometry]:
+    landmarks = face.landmark_2d_106
+    if landmarks is None:
+        return None
+    height, width = frame_shape[:2]
+    face_hull = get_face_hull(landmarks)
+    x1, y1 = face_hull.min(axis=0) - FACE_MASK_BLUR_RADIUS - 1
+    x2, y2 = face_hull.max(axis=0) + FACE_MASK_BLUR_RADIUS + 2
+    face_box = (max(int(x1), 0), max(int(y1), 0), min(int(x2), width), min(int(y2), height))
+    mouth_polygon = get_mouth_polygon(landmarks)
+    return MouthMaskGeometry(face_hull, face_box, mouth_polygon, get_mouth_box(mouth_polygon, width, height))
+
+
+def get_face_hull(landmarks: np.ndarray) -> np.ndarray:
+    """Padded convex hull of the face contour, with the forehead extended above the eyebrows."""
+    landmarks = landmarks.astype(np.int32)
+    right_side_face = landmarks[0:16]
+    left_side_face = landmarks[17:32]
+    eyebrow_top = min(np.min(landmarks[43:51, 1]), np.min(landmarks[97:105, 1]))
+    face_top = min(right_side_face[0, 1], left_side_face[-1, 1])
+    extended_forehead_height = int((face_top - eyebrow_top) * 5.0)
+
+    forehead_left = right_side_face[0].copy()
+    forehead_right = left_side_face[-1].copy()
+    forehead_left[1] -= extended_forehead_height
+    forehead_right[1] -= extended_forehead_height
+    face_outline = np.vstack([[forehead_left], right_side_face, left_side_face[::-1], [forehead_right]])
+
+    # Push every hull point 5% of the face width away from the outline centre
+    padding = int(np.linalg.norm(right_side_face[0] - left_side_face[-1]) * 0.05)
+    hull = cv2.convexHull(face_outline)[:, 0, :].astype(np.float64)
+    direction = hull - np.mean(face_outline, axis=0)
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+    return (hull + direction * padding).astype(np.int32)
+
+
+def get_mouth_polygon(landmarks: np.ndarray) -> np.ndarray:
+    """Lower lip outline expanded by mask_down_size, with the top lip and chin pushed outwards."""
+    lower_lip_landmarks = landmarks[LOWER_LIP_ORDER].astype(np.float32)
+    center = np.mean(lower_lip_landmarks, axis=0)
+    expanded_landmarks = (lower_lip_landmarks - center) * (1 + modules.globals.mask_down_size) + center
+
+    direction = expanded_landmarks[TOPLIP_INDICES] - center
+    direction /= np.linalg.norm(direction, axis=1, keepdims=True)
+    expanded_landmarks[TOPLIP_INDICES] += direction * (modules.globals.mask_size * 0.5)
+    expanded_landmarks[CHIN_INDICES, 1] += (expanded_landmarks[CHIN_INDICES, 1] - center[1]) * CHIN_EXTENSION
+    return expanded_landmarks.astype(np.int32)
+
+
+def get_mouth_box(mouth_polygon: np.ndarray, width: int, height: int) -> Box:
+    min_x, min_y = np.min(mouth_polygon, axis=0)
+    max_x, max_y = np.max(mouth_polygon, axis=0)
+    padding = int((max_x - min_x) * 0.1)
+    min_x, min_y = max(0, min_x - padding), max(0, min_y - padding)
+    max_x, max_y = min(width, max_x + padding), min(height, max_y + padding)
+    if max_x <= min_x or max_y <= min_y:
+        if (max_x - min_x) <= 1:
+            max_x = min_x + 1
+        if (max_y - min_y) <= 1:
+            max_y = min_y + 1
+    return int(min_x), int(min_y), int(max_x), int(max_y)
+
+
+def create_face_mask(geometry: MouthMaskGeometry) -> np.ndarray:
+    """Feathered uint8 face mask covering geometry.face_box only."""
+    x1, y1, x2, y2 = geometry.face_box
+    mask = get_scratch("face_mask", (max(y2 - y1, 0), max(x2 - x1, 0)), np.uint8)
+    mask.fill(0)
+    if mask.size:
+        cv2.fillConvexPoly(mask, geometry.face_hull - (x1, y1), 255)
+        cv2.GaussianBlur(mask, (5, 5), 3, dst=mask)
+    return mask
+
+
+def create_mouth_mask(geometry: MouthMaskGeometry) -> np.ndarray:
+    """Hard uint8 mask of the mouth polygon covering geometry.mouth_box only."""
+    min_x, min_y, max_x, max_y = geometry.mouth_box
+    mask = get_scratch("mouth_mask", (max_y - min_y, max_x - min_x), np.uint8)
+    mask.fill(0)
+    cv2.fillPoly(mask, [geometry.mouth_polygon - (min_x, min_y)], 255)
+    return mask
+
+
+def get_mouth_cutout(frame: Frame, geometry: MouthMaskGeometry) -> np.ndarray:
+    min_x, min_y, max_x, max_y = geometry.mouth_box
+    return frame[min_y:max_y, min_x:max_x].copy()
+
+
+def crop_box_mask(mask: np.ndarray, mask_box: Box, box: Box) -> np.ndarray:
+    """Returns the part of a box-local mask that covers another box, zero where the boxes do not overlap."""
+    min_x, min_y, max_x, max_y = box
+    cropped = get_scratch("box_mask", (max_y - min_y, max_x - min_x), mask.dtype)
+    cropped.fill(0)
+    x1, y1 = max(min_x, mask_box[0]), max(min_y, mask_box[1])
+    x2, y2 = min(max_x, mask_box[2]), min(max_y, mask_box[3])
+    if x2 > x1 and y2 > y1:
+        cropped[y1 - min_y:y2 - min_y, x1 - min_x:x2 - min_x] = mask[y1 - mask_box[1]:y2 - mask_box[1], x1 - mask_box[0]:x2 - mask_box[0]]
+    return cropped
+
+
+def feather_mask(mask: np.ndarray, sigma: int) -> np.ndarray:
+    """Gaussian-feathered float32 copy of a uint8 mask, blurred at reduced resolution when the sigma is wide."""
+    height, width = mask.shape
+    feathered_mask = get_scratch("mouth_feather", (height, width), np.float32)
+    scale = max(1, sigma // FEATHER_SIGMA)
+    if scale == 1:
+        np.copyto(feathered_mask, mask, casting="unsafe")
+        return cv2.GaussianBlur(feathered_mask, (0, 0), sigma, dst=feathered_mask)
+    small_size = (max(1, width // scale), max(1, height // scale))
+    small_mask = cv2.resize(mask, small_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+    cv2.GaussianBlur(small_mask, (0, 0), sigma * small_size[0] / width, dst=small_mask)
+    return cv2.resize(small_mask, (width, height), dst=feathered_mask, interpolation=cv2.INTER_LINEAR)
+
+
+def create_mouth_masks(geometry: MouthMaskGeometry) -> Optional[MouthMasks]:
+    """Builds the blend masks of a face, None when its mouth box is too small to feather."""
+    min_x, min_y, max_x, max_y = geometry.mouth_box
+    box_width, box_height = max_x - min_x, max_y - min_y
+    feather_amount = min(30, box_width // modules.globals.mask_feather_ratio, box_height // modules.globals.mask_feather_ratio)
+    if feather_amount <= 0:
+        return None
+
+    feathered_mask = feather_mask(create_mouth_mask(geometry), feather_amount)
+    mask_max = feathered_mask.max()
+    if mask_max <= 0:
+        return None
+
+    face_mask = crop_box_mask(create_face_mask(geometry), geometry.face_box, geometry.mouth_box)
+    face_mask = np.multiply(face_mask, 1 / 255, dtype=np.float32)
+    mouth_mask = np.multiply(feathered_mask, face_mask)
+    mouth_mask *= 1 / mask_max
+    return MouthMasks(geometry, mouth_mask, face_mask)
+
+
+def apply_mouth_area(frame: Frame, mouth_cutout: np.ndarray, masks: MouthMasks) -> Frame:
+    """Blends the original mouth back over the swapped face, inside the mouth box only."""
+    min_x, min_y, max_x, max_y = masks.geometry.mouth_box
+    roi = frame[min_y:max_y, min_x:max_x]
+    if mouth_cutout is None or roi.shape != mouth_cutout.shape or roi.shape[:2] != masks.mouth_mask.shape:
+        return frame
+
+    inverse_mask = get_scratch("mouth_inverse", masks.mouth_mask.shape, np.float32)
+    roi = np.ascontiguousarray(roi)
+    color_corrected_mouth = apply_color_transfer(mouth_cutout, roi)
+    blended = cv2.blendLinear(color_corrected_mouth, roi, masks.mouth_mask, np.subtract(1.0, masks.mouth_mask, out=inverse_mask))
+    frame[min_y:max_y, min_x:max_x] = cv2.blendLinear(blended, roi, masks.face_mask, np.subtract(1.0, masks.face_mask, out=inverse_mask))
+    return frame
+
+
+def draw_mouth_mask_visualization(frame: Frame, geometry: MouthMaskGeometry) -> Frame:
+    min_x, min_y, _, max_y = geometry.mouth_box
+    vis_frame = frame.copy()
+    cv2.polylines(vis_frame, [geometry.mouth_polygon], True, (0, 255, 0), 2)
+    cv2.putText(vis_frame, "Lower Mouth Mask", (min_x, min_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    cv2.putText(vis_frame, "Feathered Mask", (min_x, max_y + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    return vis_frame
+
+
+def apply_color_transfer(source: np.ndarray, target: np.ndarray) -> np.ndarray:
+    """
+    Apply color transfer from target to source image
+    """
+    source = cv2.cvtColor(source, cv2.COLOR_BGR2LAB)
+    target = cv2.cvtColor(target, cv2.COLOR_BGR2LAB)
+
+    source_mean, source_std = cv2.meanStdDev(source)
+    target_mean, target_std = cv2.meanStdDev(target)
+
+    # Per-channel affine map, cv2.transform applies it and saturates to uint8 in one pass;
+    # the -0.5 turns its rounding into the truncation of astype(np.uint8)
+    gain = target_std / source_std
+    matrix = np.hstack([np.diagflat(gain), target_mean - source_mean * gain - 0.5])
+    return cv2.cvtColor(cv2.transform(source, matrix), cv2.COLOR_LAB2BGR)
@@ -0,0 +1,116 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import onnxruntime
+from insightface.model_zoo.arcface_onnx import ArcFaceONNX
+from insightface.model_zoo.attribute import Attribute
+from insightface.model_zoo.inswapper import INSwapper
+from insightface.model_zoo.landmark import Landmark
+from insightface.model_zoo.retinaface import RetinaFace
+
+import modules.globals
+
+SESSIONS: Dict[str, onnxruntime.InferenceSession] = {}
+THREAD_LOCK = threading.Lock()
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disabled': onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def get_session_options() -> onnxruntime.SessionOptions:
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[modules.globals.ort_graph_optimization]
+    # 0 leaves the thread count to ONNX Runtime, which uses every physical core
+    session_options.intra_op_num_threads = modules.globals.ort_intra_op_threads
+    session_options.inter_op_num_threads = modules.globals.ort_inter_op_threads
+    if modules.globals.ort_inter_op_threads > 1:
+        session_options.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return session_options
+
+
+def get_provider_options() -> List[Dict[str, Any]]:
+    return [dict(modules.globals.ort_provider_options.get(provider, {})) for provider in modules.globals.execution_providers]
+
+
+def get_cached_model_path(model_path: str) -> Optional[str]:
+    # Optimised graphs depend on the providers and level they were built for
+    if not modules.globals.ort_cache_dir or modules.globals.ort_graph_optimization == 'disabled':
+        return None
+    providers = '-'.join(provider.replace('ExecutionProvider', '').lower() for provider in modules.globals.execution_providers)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(modules.globals.ort_cache_dir, f"{name}.{providers}.{modules.globals.ort_graph_optimization}.onnx")
+
+
+def create_session(model_path: str) -> onnxruntime.InferenceSession:
+    """
+    Creates an InferenceSession with the configured thread counts, graph
+    optimisation level and provider options. With a cache directory set, the
+    optimised graph is written there on first load and loaded directly, with
+    optimisation disabled, as long as it is newer than the model.
+    """
+    session_options = get_session_options()
+    load_path = model_path
+    cached_path = get_cached_model_path(model_path)
+    if cached_path and os.path.isfile(cached_path) and os.path.getmtime(cached_path) >= os.path.getmtime(model_path):
+        load_path = cached_path
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL
+    elif cached_path:
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        session_options.optimized_model_filepath = cached_path
+
+    try:
+        return onnxruntime.InferenceSession(
+            load_path, session_options, providers=modules.globals.execution_providers, provider_options=get_provider_options()
+        )
+    except Exception as e:
+        if not cached_path:
+            raise
+        # Compiled providers such as TensorRT cannot serialise their graphs
+        print(f"Optimized model cache unavailable for {model_path}: {e}")
+        return onnxruntime.InferenceSession(
+            model_path, get_session_options(), providers=modules.globals.execution_providers, provider_options=get_provider_options()
+        )
+
+
+def get_session(model_path: str) -> onnxruntime.InferenceSession:
+    """Returns the shared session of a model, so every user of a model file runs the same session."""
+    with THREAD_LOCK:
+        if model_path not in SESSIONS:
+            SESSIONS[model_path] = create_session(model_path)
+    return SESSIONS[model_path]
+
+
+def load_model(model_path: str) -> Any:
+    """insightface.model_zoo.get_model, with the session taken from get_session."""
+    session = get_session(model_path)
+    inputs = session.get_inputs()
+    input_shape = inputs[0].shape
+    if len(session.get_outputs()) >= 5:
+        return RetinaFace(model_file=model_path, session=session)
+    if input_shape[2] == 192 and input_shape[3] == 192:
+        return Landmark(model_file=model_path, session=session)
+    if input_shape[2] == 96 and input_shape[3] == 96:
+        return Attribute(model_file=model_path, session=session)
+    if len(inputs) == 2 and input_shape[2] == 128 and input_shape[3] == 128:
+        return INSwapper(model_file=model_path, session=session)
+    if input_shape[2] == input_shape[3] and input_shape[2] >= 112 and input_shape[2] % 16 == 0:
+        return ArcFaceONNX(model_file=model_path, session=session)
+    return None
+
+
+def print_session_config() -> None:
+    providers = modules.globals.execution_providers
+    print(
+        "ONNX Runtime sessions: "
+        f"providers={providers}, "
+        f"intra_op_threads={modules.globals.ort_intra_op_threads or 'auto'}, "
+        f"inter_op_threads={modules.globals.ort_inter_op_threads or 'auto'}, "
+        f"graph_optimization={modules.globals.ort_graph_optimization}, "
+        f"cache_dir={modules.globals.ort_cache_dir or 'off'}, "
+        f"provider_options={dict(zip(providers, get_provider_options()))}"
+    )
@@ -1,12 +1,21 @@
 import sys
 import importlib
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
 from types import ModuleType
-from typing import Any, List, Callable
+from typing import Any, List, Callable, Optional
 from tqdm import tqdm
 
+import cv2
+import numpy as np
+
 import modules
 import modules.globals                   
+from modules.capturer import get_video_frame_total
+from modules.face_analyser import get_one_face
+from modules.frame_context import FrameContext
+from modules.typing import Face, Frame
+from modules.utilities import detect_resolution, open_frame_reader, open_frame_writer
 
 FRAME_PROCESSORS_MODULES: List[ModuleType] = []
 FRAME_PROCESSORS_INTERFACE = [
@@ -76,9 +85,147 @@ def multi_process_frame(source_path: str, temp_frame_paths: List[str], process_f
             future.result()
 
 
-def process_video(source_path: str, frame_paths: list[str], process_frames: Callable[[str, List[str], Any], None]) -> None:
+def multi_process_batch(source_path: str, temp_frame_paths: List[str], process_batch: Callable[[str, List[str], Any], None], progress: Any = None) -> None:
+    batch_size = modules.globals.batch_size
+    with ThreadPoolExecutor(max_workers=modules.globals.execution_threads) as executor:
+        futures = []
+        for start in range(0, len(temp_frame_paths), batch_size):
+            future = executor.submit(process_batch, source_path, temp_frame_paths[start:start + batch_size], progress)
+            futures.append(future)
+        for future in futures:
+            future.result()
+
+
+def process_video(source_path: str, frame_paths: list[str], process_frames: Callable[[str, List[str], Any], None], process_batch: Callable[[str, List[str], Any], None] = None) -> None:
     progress_bar_format = '{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]'
     total = len(frame_paths)
     with tqdm(total=total, desc='Processing', unit='frame', dynamic_ncols=True, bar_format=progress_bar_format) as progress:
         progress.set_postfix({'execution_providers': modules.globals.execution_providers, 'execution_threads': modules.globals.execution_threads, 'max_memory': modules.globals.max_memory})
-        multi_process_frame(source_path, frame_paths, process_frames, progress)
+        if process_batch:
+            multi_process_batch(source_path, frame_paths, process_batch, progress)
+        else:
+            multi_process_frame(source_path, frame_paths, process_frames, progress)
+
+
+def read_raw_frame(stream: Any, width: int, height: int) -> Optional[Frame]:
+    buffer = bytearray(width * height * 3)
+    view = memoryview(buffer)
+    size = 0
+    while size < len(buffer):
+        count = stream.readinto(view[size:])
+        if not count:
+            return None
+        size += count
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+
+
+def process_frame_chain(frame_processors: List[ModuleType], source_face: Optional[Face], temp_frame: Frame, frame_context: FrameContext) -> Frame:
+    for frame_processor in frame_processors:
+        try:
+            if modules.globals.map_faces:
+                temp_frame = frame_processor.process_frame_v2(temp_frame, frame_context.frame_path, frame_context)
+            else:
+                temp_frame = frame_processor.process_frame(source_face, temp_frame, frame_context)
+        except Exception as exception:
+            print(exception)
+    return temp_frame
+
+
+def process_video_fused(source_path: str, temp_frame_paths: List[str]) -> None:
+    """
+    Runs the whole processor chain over each temp frame in a single pass: every
+    frame is read once, handed from processor to processor in memory together
+    with its FrameContext, and written once.
+    """
+    frame_processors = get_frame_processors_modules(modules.globals.frame_processors)
+    source_face = None if modules.globals.map_faces else get_one_face(cv2.imread(source_path))
+
+    def process_frames(source_path: str, temp_frame_paths: List[str], progress: Any = None) -> None:
+        for temp_frame_path in temp_frame_paths:
+            temp_frame = cv2.imread(temp_frame_path)
+            result = process_frame_chain(frame_processors, source_face, temp_frame, FrameContext(temp_frame_path))
+            cv2.imwrite(temp_frame_path, result)
+            if progress:
+                progress.update(1)
+
+    process_video(source_path, temp_frame_paths, process_frames)
+
+
+def get_batch_processor(frame_processors: List[ModuleType]) -> Optional[ModuleType]:
+    # A lone processor with batching enabled swaps a group of frames with one inference
+    if len(frame_processors) == 1 and hasattr(frame_processors[0], 'batching_enabled') and frame_processors[0].batching_enabled():
+        return frame_processors[0]
+    return None
+
+
+def process_frame_group(frame_processors: List[ModuleType], batch_processor: Optional[ModuleType], source_face: Optional[Face], temp_frames: List[Frame]) -> List[Frame]:
+    if batch_processor is None:
+        return [process_frame_chain(frame_processors, source_face, temp_frame, FrameContext()) for temp_frame in temp_frames]
+    try:
+        return batch_processor.process_frame_batch(source_face, temp_frames)
+    except Exception as exception:
+        print(exception)
+        return temp_frames
+
+
+def process_video_stream(source_path: str, target_path: str, fps: float = 30.0) -> bool:
+    """
+    Decodes target_path with ffmpeg, runs every frame through the whole processor
+    chain in memory and pipes the results straight into an ffmpeg encoder, so no
+    frame touches the disk. Frames go to the execution threads in groups of
+    batch_size when the processor batches them, one at a time otherwise, with at
+    most two groups per execution thread in flight.
+    Returns False when ffprobe or ffmpeg fails, so the caller can fall back to temp frames.
+    """
+    frame_processors = get_frame_processors_modules(modules.globals.frame_processors)
+    source_face = get_one_face(cv2.imread(source_path))
+    execution_threads = modules.globals.execution_threads or 1
+    max_in_flight = execution_threads * 2
+    batch_processor = get_batch_processor(frame_processors)
+    group_size = modules.globals.batch_size if batch_processor else 1
+
+    reader = None
+    writer = None
+    in_flight: deque = deque()
+    progress_bar_format = '{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}{postfix}]'
+    try:
+        width, height = detect_resolution(target_path)
+        reader = open_frame_reader(target_path)
+        writer = open_frame_writer(target_path, width, height, fps)
+        with ThreadPoolExecutor(max_workers=execution_threads) as executor, tqdm(total=get_video_frame_total(target_path), desc='Processing', unit='frame', dynamic_ncols=True, bar_format=progress_bar_format) as progress:
+            progress.set_postfix({'execution_providers': modules.globals.execution_providers, 'execution_threads': execution_threads, 'max_memory': modules.globals.max_memory})
+            while True:
+                temp_frames = []
+                while len(temp_frames) < group_size:
+                    temp_frame = read_raw_frame(reader.stdout, width, height)
+                    if temp_frame is None:
+                        break
+                    temp_frames.append(temp_frame)
+                finished = len(temp_frames) < group_size
+                if temp_frames:
+                    in_flight.append(executor.submit(process_frame_group, frame_processors, batch_processor, source_face, temp_frames))
+                # Frames are written in decode order once the oldest group is done
+                while in_flight and (finished or len(in_flight) >= max_in_flight):
+                    results = in_flight.popleft().result()
+                    for result in results:
+                        writer.stdin.write(np.ascontiguousarray(result).data)
+                    progress.update(len(results))
+                if finished:
+                    break
+    except Exception as exception:
+        print(f"In-memory video processing failed: {exception}")
+        # A killed writer never finalises the truncated video at the output path
+        for process in (reader, writer):
+            if process is not None:
+                process.kill()
+        return False
+    finally:
+        for process, stream in ((reader, 'stdout'), (writer, 'stdin')):
+            if process is None:
+                continue
+            try:
+                getattr(process, stream).close()
+            except OSError:
+                pass
+            process.wait()
+    return reader.returncode == 0 and writer.returncode == 0
@@ -1,16 +1,19 @@
-from typing import Any, List
+from typing import Any, List, Optional, Tuple
 import cv2
 import threading
-import gfpgan
 import os
 
 import modules.globals
 import modules.processors.frame.core
 from modules.core import update_status
-from modules.face_analyser import get_one_face
+from modules.batch_worker import BatchWorker
+from modules.face_analyser import get_many_faces
+from modules.frame_context import FrameContext
+from modules.onnx_session import get_session
 from modules.typing import Frame, Face
 import platform
-import torch
+import numpy as np
+import onnxruntime
 from modules.utilities import (
     conditional_download,
     is_image,
@@ -18,24 +21,103 @@ from modules.utilities import (
 )
 
 FACE_ENHANCER = None
-THREAD_SEMAPHORE = threading.Semaphore()
+ENHANCER_WORKER = None
 THREAD_LOCK = threading.Lock()
 NAME = "DLC.FACE-ENHANCER"
 
+# facexlib's 5-point template for 512x512 aligned faces, which GFPGAN is trained on
+FACE_TEMPLATE = np.array(
+    [
+        [192.98138, 239.94708],
+        [318.90277, 240.1936],
+        [256.63416, 314.01935],
+        [201.26117, 371.41043],
+        [313.08905, 371.15118],
+    ],
+    dtype=np.float32,
+)
+FACE_SIZE = (512, 512)
+# facexlib parsing classes GFPGANer's paste-back keeps (255): skin, brows, eyes, ears, nose, mouth and lips,
+# without background, eyeglasses frames, earrings, neck, necklace, cloth, hair and hat
+PARSE_MASK_COLORMAP = np.array([0, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 255, 0, 255, 0, 0, 0], dtype=np.float32)
+
 abs_dir = os.path.dirname(os.path.abspath(__file__))
 models_dir = os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(abs_dir))), "models"
 )
+torch_model_path = os.path.join(models_dir, "GFPGANv1.4.pth")
+onnx_model_path = os.path.join(models_dir, "GFPGANv1.4.onnx")
+parse_onnx_model_path = os.path.join(models_dir, "parsing_parsenet.onnx")
+
+# torch is only needed for the default backend and for exporting the ONNX model
+try:
+    import torch
+    import gfpgan
+    from basicsr.utils import img2tensor, tensor2img
+    from torchvision.transforms.functional import normalize
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
 
 
 def pre_check() -> bool:
     download_directory_path = models_dir
+    if modules.globals.enhancer_backend == "onnx" and os.path.isfile(onnx_model_path) and os.path.isfile(parse_onnx_model_path):
+        return True
     conditional_download(
         download_directory_path,
         [
             "https://github.com/TencentARC/GFPGAN/releases/download/v1.3.4/GFPGANv1.4.pth"
         ],
     )
+    if modules.globals.enhancer_backend == "onnx":
+        return export_onnx_model()
+    return True
+
+
+def export_onnx_model() -> bool:
+    """
+    Exports GFPGANv1.4 and the facexlib parsing network its paste-back masks
+    faces with to ONNX once, both with a dynamic batch axis for the batched enhancer.
+    """
+    if not TORCH_AVAILABLE:
+        update_status(f"Exporting {onnx_model_path} needs torch and gfpgan installed.", NAME)
+        return False
+
+    class GFPGANOnnx(torch.nn.Module):
+        def __init__(self, gfpgan_model: Any):
+            super().__init__()
+            self.gfpgan_model = gfpgan_model
+
+        def forward(self, cropped_faces: Any) -> Any:
+            return self.gfpgan_model(cropped_faces, return_rgb=False, weight=0.5)[0]
+
+    class ParseNetOnnx(torch.nn.Module):
+        def __init__(self, parse_model: Any):
+            super().__init__()
+            self.parse_model = parse_model
+
+        def forward(self, restored_faces: Any) -> Any:
+            return self.parse_model(restored_faces)[0]
+
+    face_enhancer = gfpgan.GFPGANer(model_path=torch_model_path, upscale=1, device=torch.device("cpu"))
+    for model, model_path in (
+        (GFPGANOnnx(face_enhancer.gfpgan), onnx_model_path),
+        (ParseNetOnnx(face_enhancer.face_helper.face_parse), parse_onnx_model_path),
+    ):
+        update_status(f"Exporting {model_path}...", NAME)
+        temp_path = model_path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model.eval(),
+                torch.zeros((1, 3, FACE_SIZE[1], FACE_SIZE[0])),
+                temp_path,
+                input_names=["input"],
+                output_names=["output"],
+                dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+                opset_version=17,
+            )
+        os.replace(temp_path, model_path)
     return True
 
 
@@ -63,8 +145,11 @@ def get_face_enhancer() -> Any:
     global FACE_ENHANCER
 
     with THREAD_LOCK:
-        if FACE_ENHANCER is None:
-            model_path = os.path.join(models_dir, "GFPGANv1.4.pth")
+        if FACE_ENHANCER is None and modules.globals.enhancer_backend == "onnx":
+            FACE_ENHANCER = get_session(onnx_model_path)
+            print(f"Selected ONNX Runtime providers: {FACE_ENHANCER.get_providers()}")
+        elif FACE_ENHANCER is None:
+            model_path = torch_model_path
             
             selected_device = None
             device_priority = []
@@ -89,16 +174,160 @@ def get_face_enhancer() -> Any:
     return FACE_ENHANCER
 
 
-def enhance_face(temp_frame: Frame) -> Frame:
-    with THREAD_SEMAPHORE:
-        _, _, temp_frame = get_face_enhancer().enhance(temp_frame, paste_back=True)
+def warm_up() -> None:
+    # Run the GFPGAN and parsing networks once on a blank face crop
+    restore_and_parse_faces(get_face_enhancer(), [np.zeros((FACE_SIZE[1], FACE_SIZE[0], 3), dtype=np.uint8)])
+
+
+def align_faces(temp_frame: Frame, target_faces: List[Face]) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """Warps each target face into GFPGAN's aligned crop using the kps the pipeline already has."""
+    cropped_faces = []
+    affine_matrices = []
+    for target_face in target_faces:
+        affine_matrix = cv2.estimateAffinePartial2D(
+            np.asarray(target_face.kps, dtype=np.float32), FACE_TEMPLATE, method=cv2.LMEDS
+        )[0]
+        if affine_matrix is None:
+            continue
+        cropped_faces.append(cv2.warpAffine(
+            temp_frame, affine_matrix, FACE_SIZE,
+            borderMode=cv2.BORDER_CONSTANT, borderValue=(135, 133, 132),
+        ))
+        affine_matrices.append(affine_matrix)
+    return cropped_faces, affine_matrices
+
+
+def restore_faces(face_enhancer: Any, cropped_faces: List[np.ndarray]) -> List[np.ndarray]:
+    """Runs all aligned crops through the GFPGAN network in one forward pass."""
+    if isinstance(face_enhancer, onnxruntime.InferenceSession):
+        return restore_faces_onnx(face_enhancer, cropped_faces)
+    cropped_faces_t = torch.stack([
+        normalize(img2tensor(cropped_face / 255.0, bgr2rgb=True, float32=True), (0.5, 0.5, 0.5), (0.5, 0.5, 0.5))
+        for cropped_face in cropped_faces
+    ]).to(face_enhancer.device)
+    with torch.no_grad():
+        output = face_enhancer.gfpgan(cropped_faces_t, return_rgb=False, weight=0.5)[0]
+    return [tensor2img(restored_face, rgb2bgr=True, min_max=(-1, 1)).astype("uint8") for restored_face in output]
+
+
+def get_face_blob(faces: List[np.ndarray]) -> np.ndarray:
+    # Same normalisation as the torch path: BGR uint8 to RGB in [-1, 1]
+    return np.stack(faces)[:, :, :, ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 127.5 - 1.0
+
+
+def run_onnx_batch(session: onnxruntime.InferenceSession, blob: np.ndarray) -> np.ndarray:
+    model_input = session.get_inputs()[0]
+    if isinstance(model_input.shape[0], int) and model_input.shape[0] != len(blob):
+        # Models exported with a fixed batch size run one crop at a time
+        return np.concatenate([session.run(None, {model_input.name: blob[i:i + 1]})[0] for i in range(len(blob))])
+    return session.run(None, {model_input.name: blob})[0]
+
+
+def restore_faces_onnx(session: onnxruntime.InferenceSession, cropped_faces: List[np.ndarray]) -> List[np.ndarray]:
+    output = run_onnx_batch(session, get_face_blob(cropped_faces))
+    output = (np.clip(output, -1.0, 1.0) + 1.0) * 127.5
+    return list(np.round(output).astype(np.uint8).transpose(0, 2, 3, 1)[:, :, :, ::-1])
+
+
+def parse_faces(face_enhancer: Any, restored_faces: List[np.ndarray]) -> List[np.ndarray]:
+    """Soft masks of the restored faces from the parsing network, in one forward pass, as GFPGANer pastes with use_parse=True."""
+    blob = get_face_blob(restored_faces)
+    if isinstance(face_enhancer, onnxruntime.InferenceSession):
+        labels = run_onnx_batch(get_session(parse_onnx_model_path), blob).argmax(axis=1)
+    else:
+        with torch.no_grad():
+            output = face_enhancer.face_helper.face_parse(torch.from_numpy(blob).to(face_enhancer.device))[0]
+        labels = output.argmax(dim=1).cpu().numpy()
+
+    face_masks = []
+    for label in labels:
+        face_mask = PARSE_MASK_COLORMAP[label]
+        cv2.GaussianBlur(face_mask, (101, 101), 11, dst=face_mask)
+        cv2.GaussianBlur(face_mask, (101, 101), 11, dst=face_mask)
+        # Remove the black borders
+        face_mask[:10, :] = 0
+        face_mask[-10:, :] = 0
+        face_mask[:, :10] = 0
+        face_mask[:, -10:] = 0
+        face_mask *= 1 / 255
+        face_masks.append(face_mask)
+    return face_masks
+
+
+def restore_and_parse_faces(face_enhancer: Any, cropped_faces: List[np.ndarray]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    restored_faces = restore_faces(face_enhancer, cropped_faces)
+    return list(zip(restored_faces, parse_faces(face_enhancer, restored_faces)))
+
+
+def paste_face_region(temp_frame: Frame, restored_face: np.ndarray, face_mask: np.ndarray, affine_matrix: np.ndarray) -> None:
+    """Blends a restored face back into temp_frame in place through its parsing mask, touching only the face's bounding region."""
+    height, width = temp_frame.shape[:2]
+    face_height, face_width = restored_face.shape[:2]
+    inverse_affine = cv2.invertAffineTransform(affine_matrix)
+    corners = cv2.transform(
+        np.array([[[0, 0], [face_width, 0], [face_width, face_height], [0, face_height]]], dtype=np.float32),
+        inverse_affine,
+    )[0]
+    x1, y1 = np.maximum(np.floor(corners.min(axis=0)).astype(int) - 1, 0)
+    x2, y2 = np.minimum(np.ceil(corners.max(axis=0)).astype(int) + 1, (width, height))
+    if x2 <= x1 or y2 <= y1:
+        return
+
+    # Same warps as facexlib's paste-back, on the region only
+    inverse_affine[:, 2] -= (x1, y1)
+    region_size = (int(x2 - x1), int(y2 - y1))
+    inv_restored = cv2.warpAffine(restored_face, inverse_affine, region_size)
+    inv_soft_mask = cv2.warpAffine(face_mask, inverse_affine, region_size, flags=cv2.INTER_AREA)[:, :, None]
+
+    region = temp_frame[y1:y2, x1:x2]
+    region[:] = (inv_soft_mask * inv_restored + (1 - inv_soft_mask) * region).astype(np.uint8)
+
+
+def get_enhancer_worker() -> BatchWorker:
+    global ENHANCER_WORKER
+
+    face_enhancer = get_face_enhancer()
+    with THREAD_LOCK:
+        if ENHANCER_WORKER is None:
+            # All execution threads share one GFPGAN instance, their face crops are batched on its thread
+            ENHANCER_WORKER = BatchWorker(
+                lambda cropped_faces: restore_and_parse_faces(face_enhancer, cropped_faces),
+                modules.globals.enhancer_batch_size,
+                modules.globals.enhancer_batch_wait / 1000,
+                name="face-enhancer",
+            )
+    return ENHANCER_WORKER
+
+
+def get_enhancer_stats() -> Optional[dict]:
+    return ENHANCER_WORKER.stats() if ENHANCER_WORKER else None
+
+
+def enhance_face(temp_frame: Frame, target_faces: Optional[List[Face]] = None) -> Frame:
+    if target_faces is None:
+        target_faces = get_many_faces(temp_frame, "detection") or []
+    cropped_faces, affine_matrices = align_faces(temp_frame, target_faces)
+    if not cropped_faces:
+        return temp_frame
+    restored_faces = get_enhancer_worker().submit(cropped_faces)
+
+    temp_frame = temp_frame.copy()
+    for (restored_face, face_mask), affine_matrix in zip(restored_faces, affine_matrices):
+        paste_face_region(temp_frame, restored_face, face_mask, affine_matrix)
     return temp_frame
 
 
-def process_frame(source_face: Face, temp_frame: Frame) -> Frame:
-    target_face = get_one_face(temp_frame)
-    if target_face:
-        temp_frame = enhance_face(temp_frame)
+def get_target_faces(temp_frame: Frame, frame_context: Optional[FrameContext] = None) -> List[Face]:
+    # Reuse the faces an earlier processor already found in this frame
+    if frame_context is not None and frame_context.target_faces is not None:
+        return frame_context.target_faces
+    return get_many_faces(temp_frame, "detection") or []
+
+
+def process_frame(source_face: Face, temp_frame: Frame, frame_context: Optional[FrameContext] = None) -> Frame:
+    target_faces = get_target_faces(temp_frame, frame_context)
+    if target_faces:
+        temp_frame = enhance_face(temp_frame, target_faces)
     return temp_frame
 
 
@@ -123,8 +352,8 @@ def process_video(source_path: str, temp_frame_paths: List[str]) -> None:
     modules.processors.frame.core.process_video(None, temp_frame_paths, process_frames)
 
 
-def process_frame_v2(temp_frame: Frame) -> Frame:
-    target_face = get_one_face(temp_frame)
-    if target_face:
-        temp_frame = enhance_face(temp_frame)
+def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "", frame_context: Optional[FrameContext] = None) -> Frame:
+    target_faces = get_target_faces(temp_frame, frame_context)
+    if target_faces:
+        temp_frame = enhance_face(temp_frame, target_faces)
     return temp_frame
@@ -1,13 +1,25 @@
-from typing import Any, List
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
 import cv2
 import insightface
+from insightface.utils import face_align
 import threading
 import numpy as np
+import onnx
+import onnxruntime
+from onnx import numpy_helper
 import modules.globals
 import logging
 import modules.processors.frame.core
 from modules.core import update_status
-from modules.face_analyser import get_one_face, get_many_faces, default_source_face
+from modules.face_analyser import (
+    get_face_analyser,
+    get_one_face,
+    get_many_faces,
+    get_swap_profile,
+    default_source_face,
+    DETECTION_SIZES,
+)
 from modules.typing import Face, Frame
 from modules.utilities import (
     conditional_download,
@@ -15,10 +27,33 @@ from modules.utilities import (
     is_video,
 )
 from modules.cluster_analysis import find_closest_centroid
+from modules.face_tracker import FaceTracker
+from modules.frame_context import FrameContext
+from modules.onnx_session import load_model
+from modules.scratch_buffers import get_scratch
+from modules.mask_cache import MaskCache
+from modules.mouth_mask import (
+    MouthMasks,
+    apply_mouth_area,
+    create_mouth_masks,
+    draw_mouth_mask_visualization,
+    get_mouth_cutout,
+    get_mouth_mask_geometry,
+)
 import os
 
 FACE_SWAPPER = None
 THREAD_LOCK = threading.Lock()
+# emap-projected latents of recent source faces, keyed by their embedding
+SOURCE_LATENTS: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+SOURCE_LATENTS_SIZE = 16
+SOURCE_LATENTS_LOCK = threading.Lock()
+# paste_back masks of the inswapper crop, one per crop size
+WHITE_MASKS: dict = {}
+# One tracker per thread, each live stream is processed on its own thread
+TRACKER_STATE = threading.local()
+# Mouth masks of the last frames, per thread like the tracker
+MASK_CACHE_STATE = threading.local()
 NAME = "DLC.FACE-SWAPPER"
 
 abs_dir = os.path.dirname(os.path.abspath(__file__))
@@ -61,57 +96,340 @@ def get_face_swapper() -> Any:
     with THREAD_LOCK:
         if FACE_SWAPPER is None:
             model_path = os.path.join(models_dir, "inswapper_128_fp16.onnx")
-            FACE_SWAPPER = insightface.model_zoo.get_model(
-                model_path, providers=modules.globals.execution_providers
-            )
+            FACE_SWAPPER = load_model(get_batch_model_path(model_path))
     return FACE_SWAPPER
 
 
-def swap_face(source_face: Face, target_face: Face, temp_frame: Frame) -> Frame:
+def get_batch_model_path(model_path: str) -> str:
+    """
+    inswapper_128_fp16.onnx is exported with a batch of 1. A copy with a
+    symbolic batch dimension is written next to it once and used instead;
+    when the copy cannot be made, the fixed model swaps crops one by one.
+    """
+    batch_model_path = os.path.splitext(model_path)[0] + ".batch.onnx"
+    if os.path.isfile(batch_model_path) and os.path.getmtime(batch_model_path) >= os.path.getmtime(model_path):
+        return batch_model_path
+    if os.path.isfile(model_path) and export_batch_model(model_path, batch_model_path):
+        return batch_model_path
+    return model_path
+
+
+def export_batch_model(model_path: str, batch_model_path: str) -> bool:
+    """
+    Rewrites the batch dimension of the model inputs and outputs to a symbolic
+    one, and the leading 1 of constant Reshape shapes to 0 (copy the input
+    batch). The copy is only kept when a batch of 2 matches two single runs of
+    the original model.
+    """
+    update_status(f"Exporting {batch_model_path}...", NAME)
+    temp_path = batch_model_path + ".tmp"
+    try:
+        model = onnx.load(model_path)
+        graph = model.graph
+        initializers = {initializer.name: initializer for initializer in graph.initializer}
+        for value in list(graph.input) + list(graph.output):
+            if value.name in initializers:
+                continue
+            batch_dim = value.type.tensor_type.shape.dim[0]
+            batch_dim.Clear()
+            batch_dim.dim_param = "batch"
+        # Intermediate shapes were inferred for a batch of 1, ONNX Runtime infers them again
+        del graph.value_info[:]
+
+        shape_tensors = {node.output[0]: node.attribute[0].t for node in graph.node if node.op_type == "Constant" and node.attribute and node.attribute[0].name == "value"}
+        shape_tensors.update(initializers)
+        for node in graph.node:
+            tensor = shape_tensors.get(node.input[1]) if node.op_type == "Reshape" else None
+            if tensor is None:
+                continue
+            shape = numpy_helper.to_array(tensor).copy()
+            if shape.ndim == 1 and shape.size > 1 and shape[0] == 1:
+                shape[0] = 0
+                # In place, INSwapper reads emap from the position of the last initializer
+                tensor.CopyFrom(numpy_helper.from_array(shape, tensor.name))
+
+        onnx.save(model, temp_path)
+        if not is_batch_model_equivalent(model_path, temp_path):
+            raise ValueError("batched outputs differ from the original model")
+        os.replace(temp_path, batch_model_path)
+        return True
+    except Exception as exception:
+        update_status(f"Batching unavailable, swapping one face per inference: {exception}", NAME)
+        if os.path.isfile(temp_path):
+            os.remove(temp_path)
+        return False
+
+
+def is_batch_model_equivalent(model_path: str, batch_model_path: str) -> bool:
+    providers = ["CPUExecutionProvider"]
+    session = onnxruntime.InferenceSession(model_path, providers=providers)
+    batch_session = onnxruntime.InferenceSession(batch_model_path, providers=providers)
+    rng = np.random.default_rng(0)
+    inputs = {}
+    for model_input in session.get_inputs():
+        dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        inputs[model_input.name] = rng.standard_normal((2, *model_input.shape[1:])).astype(dtype)
+    expected = np.concatenate([
+        session.run(None, {name: value[i : i + 1] for name, value in inputs.items()})[0] for i in range(2)
+    ])
+    return np.allclose(batch_session.run(None, inputs)[0], expected, atol=1e-2)
+
+
+def warm_up() -> None:
+    # Run the analysers and the swapper session once on dummy input
+    dummy_frame = np.zeros((640, 640, 3), dtype=np.uint8)
+    get_face_analyser().get(dummy_frame)
+    det_sizes = DETECTION_SIZES if modules.globals.adaptive_detection else (640,)
+    for det_size in det_sizes:
+        get_face_analyser(get_swap_profile(), det_size).get(dummy_frame)
     face_swapper = get_face_swapper()
+    input_width, input_height = face_swapper.input_size
+    blob = np.zeros((1, 3, input_height, input_width), dtype=np.float32)
+    latent = np.zeros((1, face_swapper.emap.shape[1]), dtype=np.float32)
+    face_swapper.session.run(
+        face_swapper.output_names,
+        {face_swapper.input_names[0]: blob, face_swapper.input_names[1]: latent},
+    )
+
 
-    # Apply the face swap
-    swapped_frame = face_swapper.get(
-        temp_frame, target_face, source_face, paste_back=True
+def get_source_latent(source_face: Face) -> np.ndarray:
+    normed_embedding = source_face.normed_embedding
+    key = normed_embedding.tobytes()
+    with SOURCE_LATENTS_LOCK:
+        latent = SOURCE_LATENTS.get(key)
+        if latent is not None:
+            SOURCE_LATENTS.move_to_end(key)
+            return latent
+
+    # Same projection INSwapper.get applies to the source embedding
+    face_swapper = get_face_swapper()
+    latent = np.dot(normed_embedding.reshape((1, -1)), face_swapper.emap)
+    latent /= np.linalg.norm(latent)
+    latent = latent.astype(np.float32)
+    with SOURCE_LATENTS_LOCK:
+        SOURCE_LATENTS[key] = latent
+        while len(SOURCE_LATENTS) > SOURCE_LATENTS_SIZE:
+            SOURCE_LATENTS.popitem(last=False)
+    return latent
+
+
+def prepare_source(source_face: Face) -> None:
+    # Called when the source is set, so the first swap does not project it
+    get_source_latent(source_face)
+
+
+def supports_batch() -> bool:
+    batch_dim = get_face_swapper().session.get_inputs()[0].shape[0]
+    return not isinstance(batch_dim, int) or batch_dim < 1
+
+
+def run_swapper(blob: np.ndarray, latent: np.ndarray) -> np.ndarray:
+    """Runs inswapper on a (N, 3, H, W) blob of aligned crops, batched when the model allows it."""
+    face_swapper = get_face_swapper()
+    if blob.shape[0] == 1 or supports_batch():
+        return face_swapper.session.run(
+            face_swapper.output_names,
+            {
+                face_swapper.input_names[0]: blob,
+                face_swapper.input_names[1]: np.repeat(latent, blob.shape[0], axis=0),
+            },
+        )[0]
+    return np.concatenate([run_swapper(blob[i : i + 1], latent) for i in range(blob.shape[0])])
+
+
+def paste_back(target_frame: Frame, bgr_fake: np.ndarray, M: np.ndarray) -> None:
+    """
+    Same blending as INSwapper.get(paste_back=True), done in place on
+    target_frame and limited to the bounding region of the warped face.
+    """
+    height, width = target_frame.shape[:2]
+    crop_size = bgr_fake.shape[0]
+    IM = cv2.invertAffineTransform(M)
+    corners = cv2.transform(
+        np.array([[[0, 0], [crop_size, 0], [crop_size, crop_size], [0, crop_size]]], dtype=np.float32), IM
+    )[0]
+    (left, top), (right, bottom) = corners.min(axis=0), corners.max(axis=0)
+    # Keep zero mask around the face so erosion and blur behave as on the full frame
+    margin = max(int(np.sqrt((right - left) * (bottom - top))) // 20, 5) + 2
+    x1, y1 = max(int(left) - margin, 0), max(int(top) - margin, 0)
+    x2, y2 = min(int(np.ceil(right)) + margin, width), min(int(np.ceil(bottom)) + margin, height)
+    if x2 <= x1 or y2 <= y1:
+        return
+    region_width, region_height = x2 - x1, y2 - y1
+    IM[:, 2] -= (x1, y1)
+
+    white = WHITE_MASKS.get(crop_size)
+    if white is None:
+        white = WHITE_MASKS.setdefault(crop_size, np.full((crop_size, crop_size), 255, dtype=np.float32))
+    fake = cv2.warpAffine(
+        bgr_fake, IM, (region_width, region_height),
+        dst=get_scratch("paste_fake", (region_height, region_width, 3), np.uint8), borderValue=0.0,
+    )
+    mask = cv2.warpAffine(
+        white, IM, (region_width, region_height),
+        dst=get_scratch("paste_mask", (region_height, region_width), np.float32), borderValue=0.0,
     )
+    mask[mask > 20] = 255
+    _, _, mask_w, mask_h = cv2.boundingRect(cv2.compare(mask, 255, cv2.CMP_EQ))
+    if mask_w == 0:
+        return
+    mask_size = int(np.sqrt((mask_h - 1) * (mask_w - 1)))
+    k = max(mask_size // 10, 10)
+    eroded = cv2.erode(mask, np.ones((k, k), np.uint8), dst=get_scratch("paste_eroded", mask.shape, np.float32))
+    k = max(mask_size // 20, 5)
+    soft = cv2.GaussianBlur(eroded, (2 * k + 1, 2 * k + 1), 0, dst=mask)
+    soft *= 1 / 255
+    inverse = np.subtract(1.0, soft, out=get_scratch("paste_inverse", mask.shape, np.float32))
+
+    region = target_frame[y1:y2, x1:x2]
+    region[:] = cv2.blendLinear(fake, np.ascontiguousarray(region), soft, inverse)
+
+
+def swap_faces_batch(
+    source_face: Face, frames: List[Frame], frame_faces: List[List[Face]]
+) -> List[Frame]:
+    """
+    Swaps every target face of several frames with one inswapper inference:
+    all faces are aligned, stacked into one blob, swapped together and the
+    results are scattered back to their frames for paste-back.
+    """
+    face_swapper = get_face_swapper()
+    crops: List[np.ndarray] = []
+    owners: List[Tuple[int, np.ndarray]] = []
+    for index, (frame, faces) in enumerate(zip(frames, frame_faces)):
+        for target_face in faces:
+            aimg, M = face_align.norm_crop2(frame, target_face.kps, face_swapper.input_size[0])
+            crops.append(aimg)
+            owners.append((index, M))
+    if not crops:
+        return frames
+
+    preds = run_swapper(get_swapper_blob(crops), get_source_latent(source_face))
+
+    results = list(frames)
+    for pred, (index, M) in zip(preds, owners):
+        if results[index] is frames[index]:
+            results[index] = frames[index].copy()
+        paste_back(results[index], get_fake_face(pred), M)
+    return results
+
+
+def get_swapper_blob(crops: List[np.ndarray]) -> np.ndarray:
+    face_swapper = get_face_swapper()
+    return cv2.dnn.blobFromImages(
+        crops,
+        1.0 / face_swapper.input_std,
+        face_swapper.input_size,
+        (face_swapper.input_mean, face_swapper.input_mean, face_swapper.input_mean),
+        swapRB=True,
+    )
+
+
+def get_fake_face(pred: np.ndarray) -> np.ndarray:
+    return np.clip(255 * pred.transpose((1, 2, 0)), 0, 255).astype(np.uint8)[:, :, ::-1]
+
+
+def swap_face(source_face: Face, target_face: Face, temp_frame: Frame) -> Frame:
+    face_swapper = get_face_swapper()
+
+    # Apply the face swap, with the cached source latent instead of INSwapper.get re-projecting it
+    aimg, M = face_align.norm_crop2(temp_frame, target_face.kps, face_swapper.input_size[0])
+    pred = run_swapper(get_swapper_blob([aimg]), get_source_latent(source_face))[0]
+    swapped_frame = temp_frame.copy()
+    paste_back(swapped_frame, get_fake_face(pred), M)
 
     if modules.globals.mouth_mask:
-        # Create a mask for the target face
-        face_mask = create_face_mask(target_face, temp_frame)
+        swapped_frame = apply_mouth_mask(swapped_frame, target_face, temp_frame)
+    return swapped_frame
 
-        # Create the mouth mask
-        mouth_mask, mouth_cutout, mouth_box, lower_lip_polygon = (
-            create_lower_mouth_mask(target_face, temp_frame)
-        )
 
-        # Apply the mouth area
-        swapped_frame = apply_mouth_area(
-            swapped_frame, mouth_cutout, mouth_box, face_mask, lower_lip_polygon
-        )
+def swap_faces(source_face: Face, target_faces: List[Face], temp_frame: Frame) -> Frame:
+    """Swaps all target faces of a frame with one batched inswapper inference and a single paste pass."""
+    swapped_frame = swap_faces_batch(source_face, [temp_frame], [target_faces])[0]
+    if modules.globals.mouth_mask:
+        for target_face in target_faces:
+            swapped_frame = apply_mouth_mask(swapped_frame, target_face, temp_frame)
+    return swapped_frame
 
-        if modules.globals.show_mouth_mask_box:
-            mouth_mask_data = (mouth_mask, mouth_cutout, mouth_box, lower_lip_polygon)
-            swapped_frame = draw_mouth_mask_visualization(
-                swapped_frame, target_face, mouth_mask_data
-            )
 
+def apply_mouth_mask(swapped_frame: Frame, target_face: Face, temp_frame: Frame) -> Frame:
+    # Masks are built from the unswapped frame so the original mouth is kept
+    masks = get_mouth_masks(target_face, temp_frame.shape)
+    if masks is None:
+        return swapped_frame
+    mouth_cutout = get_mouth_cutout(temp_frame, masks.geometry)
+    swapped_frame = apply_mouth_area(swapped_frame, mouth_cutout, masks)
+
+    if modules.globals.show_mouth_mask_box:
+        swapped_frame = draw_mouth_mask_visualization(swapped_frame, masks.geometry)
     return swapped_frame
 
 
-def process_frame(source_face: Face, temp_frame: Frame) -> Frame:
+def build_mouth_masks(target_face: Face, frame_shape: Tuple[int, ...]) -> Optional[MouthMasks]:
+    geometry = get_mouth_mask_geometry(target_face, frame_shape)
+    return create_mouth_masks(geometry) if geometry is not None else None
+
+
+def get_mouth_masks(target_face: Face, frame_shape: Tuple[int, ...]) -> Optional[MouthMasks]:
+    # In live mode, masks of a face that barely moved are reused from the previous frames
+    if modules.globals.mask_reuse_threshold > 0:
+        return get_mask_cache().get(target_face, frame_shape, lambda face: build_mouth_masks(face, frame_shape))
+    return build_mouth_masks(target_face, frame_shape)
+
+
+def get_mask_cache() -> MaskCache:
+    mask_cache = getattr(MASK_CACHE_STATE, "mask_cache", None)
+    if mask_cache is None or mask_cache.threshold != modules.globals.mask_reuse_threshold:
+        mask_cache = MaskCache(modules.globals.mask_reuse_threshold)
+        MASK_CACHE_STATE.mask_cache = mask_cache
+    return mask_cache
+
+
+def get_face_tracker() -> FaceTracker:
+    tracker = getattr(TRACKER_STATE, "tracker", None)
+    if tracker is None or tracker.detection_interval != modules.globals.face_tracking_interval:
+        tracker = FaceTracker(modules.globals.face_tracking_interval)
+        TRACKER_STATE.tracker = tracker
+    return tracker
+
+
+def detect_target_faces(temp_frame: Frame, live: bool = False) -> List[Face]:
+    profile = get_swap_profile()
+    # The detection size follows the previous frame, which only holds for live frames
+    adaptive = live and modules.globals.adaptive_detection
+    if modules.globals.many_faces:
+        return get_many_faces(temp_frame, profile, adaptive) or []
+    target_face = get_one_face(temp_frame, profile, adaptive)
+    return [target_face] if target_face else []
+
+
+def get_target_faces(temp_frame: Frame, frame_context: Optional[FrameContext] = None) -> List[Face]:
+    # In live mode, tracking replaces most detector runs; video frames reach
+    # the worker threads out of order, so they are always detected
+    live = frame_context is not None and frame_context.live
+    if modules.globals.face_tracking and live:
+        target_faces = get_face_tracker().update(temp_frame, lambda frame: detect_target_faces(frame, live=True))
+    else:
+        target_faces = detect_target_faces(temp_frame, live)
+    if frame_context is not None:
+        frame_context.target_faces = target_faces
+    return target_faces
+
+
+def process_frame(source_face: Face, temp_frame: Frame, frame_context: Optional[FrameContext] = None) -> Frame:
     if modules.globals.color_correction:
         temp_frame = cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB)
 
     if modules.globals.many_faces:
-        many_faces = get_many_faces(temp_frame)
+        many_faces = get_target_faces(temp_frame, frame_context)
         if many_faces:
-            for target_face in many_faces:
-                if source_face and target_face:
-                    temp_frame = swap_face(source_face, target_face, temp_frame)
-                else:
-                    print("Face detection failed for target/source.")
+            if source_face:
+                temp_frame = swap_faces(source_face, many_faces, temp_frame)
+            else:
+                print("Face detection failed for target/source.")
     else:
-        target_face = get_one_face(temp_frame)
+        target_faces = get_target_faces(temp_frame, frame_context)
+        target_face = target_faces[0] if target_faces else None
         if target_face and source_face:
             temp_frame = swap_face(source_face, target_face, temp_frame)
         else:
@@ -120,13 +438,14 @@ def process_frame(source_face: Face, temp_frame: Frame) -> Frame:
 
 
 
-def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "") -> Frame:
+def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "", frame_context: Optional[FrameContext] = None) -> Frame:
+    swapped_faces = []
     if is_image(modules.globals.target_path):
         if modules.globals.many_faces:
             source_face = default_source_face()
             for map in modules.globals.source_target_map:
-                target_face = map["target"]["face"]
-                temp_frame = swap_face(source_face, target_face, temp_frame)
+                swapped_faces.append(map["target"]["face"])
+            temp_frame = swap_faces(source_face, swapped_faces, temp_frame)
 
         elif not modules.globals.many_faces:
             for map in modules.globals.source_target_map:
@@ -134,6 +453,7 @@ def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "") -> Frame:
                     source_face = map["source"]["face"]
                     target_face = map["target"]["face"]
                     temp_frame = swap_face(source_face, target_face, temp_frame)
+                    swapped_faces.append(target_face)
 
     elif is_video(modules.globals.target_path):
         if modules.globals.many_faces:
@@ -146,8 +466,8 @@ def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "") -> Frame:
                 ]
 
                 for frame in target_frame:
-                    for target_face in frame["faces"]:
-                        temp_frame = swap_face(source_face, target_face, temp_frame)
+                    swapped_faces.extend(frame["faces"])
+            temp_frame = swap_faces(source_face, swapped_faces, temp_frame)
 
         elif not modules.globals.many_faces:
             for map in modules.globals.source_target_map:
@@ -162,14 +482,15 @@ def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "") -> Frame:
                     for frame in target_frame:
                         for target_face in frame["faces"]:
                             temp_frame = swap_face(source_face, target_face, temp_frame)
+                            swapped_faces.append(target_face)
 
     else:
-        detected_faces = get_many_faces(temp_frame)
+        detected_faces = get_many_faces(temp_frame, get_swap_profile(embedding=True))
+        swapped_faces = detected_faces or []
         if modules.globals.many_faces:
             if detected_faces:
                 source_face = default_source_face()
-                for target_face in detected_faces:
-                    temp_frame = swap_face(source_face, target_face, temp_frame)
+                temp_frame = swap_faces(source_face, detected_faces, temp_frame)
 
         elif not modules.globals.many_faces:
             if detected_faces:
@@ -207,6 +528,10 @@ def process_frame_v2(temp_frame: Frame, temp_frame_path: str = "") -> Frame:
                             temp_frame,
                         )
                         i += 1
+
+    # An empty list from the mapped modes only means nothing was mapped, not that no face is present
+    if frame_context is not None and swapped_faces:
+        frame_context.target_faces = swapped_faces
     return temp_frame
 
 
@@ -238,6 +563,38 @@ def process_frames(
                 progress.update(1)
 
 
+def batching_enabled() -> bool:
+    # The mouth mask needs per-face processing and mapped faces per-frame maps, neither is batched
+    return (
+        modules.globals.batch_size > 1
+        and not modules.globals.map_faces
+        and not modules.globals.mouth_mask
+    )
+
+
+def process_frame_batch(source_face: Face, temp_frames: List[Frame]) -> List[Frame]:
+    """Swaps a group of in-memory frames with one batched inswapper inference."""
+    if modules.globals.color_correction:
+        temp_frames = [cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB) for temp_frame in temp_frames]
+    frame_faces = [detect_target_faces(temp_frame) for temp_frame in temp_frames]
+    return swap_faces_batch(source_face, temp_frames, frame_faces)
+
+
+def process_batch(
+    source_path: str, temp_frame_paths: List[str], progress: Any = None
+) -> None:
+    source_face = get_one_face(cv2.imread(source_path))
+    frames = [cv2.imread(temp_frame_path) for temp_frame_path in temp_frame_paths]
+    try:
+        results = process_frame_batch(source_face, frames)
+        for temp_frame_path, result in zip(temp_frame_paths, results):
+            cv2.imwrite(temp_frame_path, result)
+    except Exception as exception:
+        print(exception)
+    if progress:
+        progress.update(len(temp_frame_paths))
+
+
 def process_image(source_path: str, target_path: str, output_path: str) -> None:
     if not modules.globals.map_faces:
         source_face = get_one_face(cv2.imread(source_path))
@@ -260,363 +617,8 @@ def process_video(source_path: str, temp_frame_paths: List[str]) -> None:
             "Many faces enabled. Using first source image. Progressing...", NAME
         )
     modules.processors.frame.core.process_video(
-        source_path, temp_frame_paths, process_frames
+        source_path,
+        temp_frame_paths,
+        process_frames,
+        process_batch if batching_enabled() else None,
     )
-
-
-def create_lower_mouth_mask(
-    face: Face, frame: Frame
-) -> (np.ndarray, np.ndarray, tuple, np.ndarray):
-    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-    mouth_cutout = None
-    landmarks = face.landmark_2d_106
-    if landmarks is not None:
-        #                  0  1  2  3  4  5  6  7  8  9  10 11 12 13 14 15 16 17 18 19 20
-        lower_lip_order = [
-            65,
-            66,
-            62,
-            70,
-            69,
-            18,
-            19,
-            20,
-            21,
-            22,
-            23,
-            24,
-            0,
-            8,
-            7,
-            6,
-            5,
-            4,
-            3,
-            2,
-            65,
-        ]
-        lower_lip_landmarks = landmarks[lower_lip_order].astype(
-            np.float32
-        )  # Use float for precise calculations
-
-        # Calculate the center of the landmarks
-        center = np.mean(lower_lip_landmarks, axis=0)
-
-        # Expand the landmarks outward
-        expansion_factor = (
-            1 + modules.globals.mask_down_size
-        )  # Adjust this for more or less expansion
-        expanded_landmarks = (lower_lip_landmarks - center) * expansion_factor + center
-
-        # Extend the top lip part
-        toplip_indices = [
-            20,
-            0,
-            1,
-            2,
-            3,
-            4,
-            5,
-        ]  # Indices for landmarks 2, 65, 66, 62, 70, 69, 18
-        toplip_extension = (
-            modules.globals.mask_size * 0.5
-        )  # Adjust this factor to control the extension
-        for idx in toplip_indices:
-            direction = expanded_landmarks[idx] - center
-            direction = direction / np.linalg.norm(direction)
-            expanded_landmarks[idx] += direction * toplip_extension
-
-        # Extend the bottom part (chin area)
-        chin_indices = [
-            11,
-            12,
-            13,
-            14,
-            15,
-            16,
-        ]  # Indices for landmarks 21, 22, 23, 24, 0, 8
-        chin_extension = 2 * 0.2  # Adjust this factor to control the extension
-        for idx in chin_indices:
-            expanded_landmarks[idx][1] += (
-                expanded_landmarks[idx][1] - center[1]
-            ) * chin_extension
-
-        # Convert back to integer coordinates
-        expanded_landmarks = expanded_landmarks.astype(np.int32)
-
-        # Calculate bounding box for the expanded lower mouth
-        min_x, min_y = np.min(expanded_landmarks, axis=0)
-        max_x, max_y = np.max(expanded_landmarks, axis=0)
-
-        # Add some padding to the bounding box
-        padding = int((max_x - min_x) * 0.1)  # 10% padding
-        min_x = max(0, min_x - padding)
-        min_y = max(0, min_y - padding)
-        max_x = min(frame.shape[1], max_x + padding)
-        max_y = min(frame.shape[0], max_y + padding)
-
-        # Ensure the bounding box dimensions are valid
-        if max_x <= min_x or max_y <= min_y:
-            if (max_x - min_x) <= 1:
-                max_x = min_x + 1
-            if (max_y - min_y) <= 1:
-                max_y = min_y + 1
-
-        # Create the mask
-        mask_roi = np.zeros((max_y - min_y, max_x - min_x), dtype=np.uint8)
-        cv2.fillPoly(mask_roi, [expanded_landmarks - [min_x, min_y]], 255)
-
-        # Apply Gaussian blur to soften the mask edges
-        mask_roi = cv2.GaussianBlur(mask_roi, (15, 15), 5)
-
-        # Place the mask ROI in the full-sized mask
-        mask[min_y:max_y, min_x:max_x] = mask_roi
-
-        # Extract the masked area from the frame
-        mouth_cutout = frame[min_y:max_y, min_x:max_x].copy()
-
-        # Return the expanded lower lip polygon in original frame coordinates
-        lower_lip_polygon = expanded_landmarks
-
-    return mask, mouth_cutout, (min_x, min_y, max_x, max_y), lower_lip_polygon
-
-
-def draw_mouth_mask_visualization(
-    frame: Frame, face: Face, mouth_mask_data: tuple
-) -> Frame:
-    landmarks = face.landmark_2d_106
-    if landmarks is not None and mouth_mask_data is not None:
-        mask, mouth_cutout, (min_x, min_y, max_x, max_y), lower_lip_polygon = (
-            mouth_mask_data
-        )
-
-        vis_frame = frame.copy()
-
-        # Ensure coordinates are within frame bounds
-        height, width = vis_frame.shape[:2]
-        min_x, min_y = max(0, min_x), max(0, min_y)
-        max_x, max_y = min(width, max_x), min(height, max_y)
-
-        # Adjust mask to match the region size
-        mask_region = mask[0 : max_y - min_y, 0 : max_x - min_x]
-
-        # Remove the color mask overlay
-        # color_mask = cv2.applyColorMap((mask_region * 255).astype(np.uint8), cv2.COLORMAP_JET)
-
-        # Ensure shapes match before blending
-        vis_region = vis_frame[min_y:max_y, min_x:max_x]
-        # Remove blending with color_mask
-        # if vis_region.shape[:2] == color_mask.shape[:2]:
-        #     blended = cv2.addWeighted(vis_region, 0.7, color_mask, 0.3, 0)
-        #     vis_frame[min_y:max_y, min_x:max_x] = blended
-
-        # Draw the lower lip polygon
-        cv2.polylines(vis_frame, [lower_lip_polygon], True, (0, 255, 0), 2)
-
-        # Remove the red box
-        # cv2.rectangle(vis_frame, (min_x, min_y), (max_x, max_y), (0, 0, 255), 2)
-
-        # Visualize the feathered mask
-        feather_amount = max(
-            1,
-            min(
-                30,
-                (max_x - min_x) // modules.globals.mask_feather_ratio,
-                (max_y - min_y) // modules.globals.mask_feather_ratio,
-            ),
-        )
-        # Ensure kernel size is odd
-        kernel_size = 2 * feather_amount + 1
-        feathered_mask = cv2.GaussianBlur(
-            mask_region.astype(float), (kernel_size, kernel_size), 0
-        )
-        feathered_mask = (feathered_mask / feathered_mask.max() * 255).astype(np.uint8)
-        # Remove the feathered mask color overlay
-        # color_feathered_mask = cv2.applyColorMap(feathered_mask, cv2.COLORMAP_VIRIDIS)
-
-        # Ensure shapes match before blending feathered mask
-        # if vis_region.shape == color_feathered_mask.shape:
-        #     blended_feathered = cv2.addWeighted(vis_region, 0.7, color_feathered_mask, 0.3, 0)
-        #     vis_frame[min_y:max_y, min_x:max_x] = blended_feathered
-
-        # Add labels
-        cv2.putText(
-            vis_frame,
-            "Lower Mouth Mask",
-            (min_x, min_y - 10),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (255, 255, 255),
-            1,
-        )
-        cv2.putText(
-            vis_frame,
-            "Feathered Mask",
-            (min_x, max_y + 20),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (255, 255, 255),
-            1,
-        )
-
-        return vis_frame
-    return frame
-
-
-def apply_mouth_area(
-    frame: np.ndarray,
-    mouth_cutout: np.ndarray,
-    mouth_box: tuple,
-    face_mask: np.ndarray,
-    mouth_polygon: np.ndarray,
-) -> np.ndarray:
-    min_x, min_y, max_x, max_y = mouth_box
-    box_width = max_x - min_x
-    box_height = max_y - min_y
-
-    if (
-        mouth_cutout is None
-        or box_width is None
-        or box_height is None
-        or face_mask is None
-        or mouth_polygon is None
-    ):
-        return frame
-
-    try:
-        resized_mouth_cutout = cv2.resize(mouth_cutout, (box_width, box_height))
-        roi = frame[min_y:max_y, min_x:max_x]
-
-        if roi.shape != resized_mouth_cutout.shape:
-            resized_mouth_cutout = cv2.resize(
-                resized_mouth_cutout, (roi.shape[1], roi.shape[0])
-            )
-
-        color_corrected_mouth = apply_color_transfer(resized_mouth_cutout, roi)
-
-        # Use the provided mouth polygon to create the mask
-        polygon_mask = np.zeros(roi.shape[:2], dtype=np.uint8)
-        adjusted_polygon = mouth_polygon - [min_x, min_y]
-        cv2.fillPoly(polygon_mask, [adjusted_polygon], 255)
-
-        # Apply feathering to the polygon mask
-        feather_amount = min(
-            30,
-            box_width // modules.globals.mask_feather_ratio,
-            box_height // modules.globals.mask_feather_ratio,
-        )
-        feathered_mask = cv2.GaussianBlur(
-            polygon_mask.astype(float), (0, 0), feather_amount
-        )
-        feathered_mask = feathered_mask / feathered_mask.max()
-
-        face_mask_roi = face_mask[min_y:max_y, min_x:max_x]
-        combined_mask = feathered_mask * (face_mask_roi / 255.0)
-
-        combined_mask = combined_mask[:, :, np.newaxis]
-        blended = (
-            color_corrected_mouth * combined_mask + roi * (1 - combined_mask)
-        ).astype(np.uint8)
-
-        # Apply face mask to blended result
-        face_mask_3channel = (
-            np.repeat(face_mask_roi[:, :, np.newaxis], 3, axis=2) / 255.0
-        )
-        final_blend = blended * face_mask_3channel + roi * (1 - face_mask_3channel)
-
-        frame[min_y:max_y, min_x:max_x] = final_blend.astype(np.uint8)
-    except Exception as e:
-        pass
-
-    return frame
-
-
-def create_face_mask(face: Face, frame: Frame) -> np.ndarray:
-    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-    landmarks = face.landmark_2d_106
-    if landmarks is not None:
-        # Convert landmarks to int32
-        landmarks = landmarks.astype(np.int32)
-
-        # Extract facial features
-        right_side_face = landmarks[0:16]
-        left_side_face = landmarks[17:32]
-        right_eye = landmarks[33:42]
-        right_eye_brow = landmarks[43:51]
-        left_eye = landmarks[87:96]
-        left_eye_brow = landmarks[97:105]
-
-        # Calculate forehead extension
-        right_eyebrow_top = np.min(right_eye_brow[:, 1])
-        left_eyebrow_top = np.min(left_eye_brow[:, 1])
-        eyebrow_top = min(right_eyebrow_top, left_eyebrow_top)
-
-        face_top = np.min([right_side_face[0, 1], left_side_face[-1, 1]])
-        forehead_height = face_top - eyebrow_top
-        extended_forehead_height = int(forehead_height * 5.0)  # Extend by 50%
-
-        # Create forehead points
-        forehead_left = right_side_face[0].copy()
-        forehead_right = left_side_face[-1].copy()
-        forehead_left[1] -= extended_forehead_height
-        forehead_right[1] -= extended_forehead_height
-
-        # Combine all points to create the face outline
-        face_outline = np.vstack(
-            [
-                [forehead_left],
-                right_side_face,
-                left_side_face[
-                    ::-1
-                ],  # Reverse left side to create a continuous outline
-                [forehead_right],
-            ]
-        )
-
-        # Calculate padding
-        padding = int(
-            np.linalg.norm(right_side_face[0] - left_side_face[-1]) * 0.05
-        )  # 5% of face width
-
-        # Create a slightly larger convex hull for padding
-        hull = cv2.convexHull(face_outline)
-        hull_padded = []
-        for point in hull:
-            x, y = point[0]
-            center = np.mean(face_outline, axis=0)
-            direction = np.array([x, y]) - center
-            direction = direction / np.linalg.norm(direction)
-            padded_point = np.array([x, y]) + direction * padding
-            hull_padded.append(padded_point)
-
-        hull_padded = np.array(hull_padded, dtype=np.int32)
-
-        # Fill the padded convex hull
-        cv2.fillConvexPoly(mask, hull_padded, 255)
-
-        # Smooth the mask edges
-        mask = cv2.GaussianBlur(mask, (5, 5), 3)
-
-    return mask
-
-
-def apply_color_transfer(source, target):
-    """
-    Apply color transfer from target to source image
-    """
-    source = cv2.cvtColor(source, cv2.COLOR_BGR2LAB).astype("float32")
-    target = cv2.cvtColor(target, cv2.COLOR_BGR2LAB).astype("float32")
-
-    source_mean, source_std = cv2.meanStdDev(source)
-    target_mean, target_std = cv2.meanStdDev(target)
-
-    # Reshape mean and std to be broadcastable
-    source_mean = source_mean.reshape(1, 1, 3)
-    source_std = source_std.reshape(1, 1, 3)
-    target_mean = target_mean.reshape(1, 1, 3)
-    target_std = target_std.reshape(1, 1, 3)
-
-    # Perform the color transfer
-    source = (source - source_mean) * (target_std / source_std) + target_mean
-
-    return cv2.cvtColor(np.clip(source, 0, 255).astype("uint8"), cv2.COLOR_LAB2BGR)
@@ -0,0 +1,17 @@
+import threading
+from typing import Any, Tuple
+
+import numpy as np
+
+# One set of buffers per thread, every execution thread works on its own frames
+SCRATCH_STATE = threading.local()
+
+
+def get_scratch(name: str, shape: Tuple[int, ...], dtype: Any) -> np.ndarray:
+    """Returns a contiguous view of a per-thread buffer that only grows, so per-face work does not allocate."""
+    size = int(np.prod(shape))
+    buffer = getattr(SCRATCH_STATE, name, None)
+    if buffer is None or buffer.size < size or buffer.dtype != dtype:
+        buffer = np.empty(size, dtype=dtype)
+        setattr(SCRATCH_STATE, name, buffer)
+    return buffer[:size].reshape(shape)
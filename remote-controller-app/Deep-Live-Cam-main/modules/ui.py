@@ -16,9 +16,11 @@ from modules.face_analyser import (
     add_blank_map,
     has_valid_map,
     simplify_maps,
+    get_last_detection_size,
 )
 from modules.capturer import get_video_frame, get_video_frame_total
 from modules.processors.frame.core import get_frame_processors_modules
+from modules.frame_context import FrameContext
 from modules.utilities import (
     is_image,
     is_video,
@@ -26,11 +28,8 @@ from modules.utilities import (
     has_image_extension,
 )
 from modules.video_capture import VideoCapturer
+from modules.camera_registry import get_camera_registry
 from modules.gettext import LanguageManager
-import platform
-
-if platform.system() == "Windows":
-    from pygrabber.dshow_graph import FilterGraph
 
 ROOT = None
 POPUP = None
@@ -799,80 +798,29 @@ def webcam_preview(root: ctk.CTk, camera_index: int):
 
 
 def get_available_cameras():
-    """Returns a list of available camera names and indices."""
-    if platform.system() == "Windows":
-        try:
-            graph = FilterGraph()
-            devices = graph.get_input_devices()
-
-            # Create list of indices and names
-            camera_indices = list(range(len(devices)))
-            camera_names = devices
-
-            # If no cameras found through DirectShow, try OpenCV fallback
-            if not camera_names:
-                # Try to open camera with index -1 and 0
-                test_indices = [-1, 0]
-                working_cameras = []
-
-                for idx in test_indices:
-                    cap = cv2.VideoCapture(idx)
-                    if cap.isOpened():
-                        working_cameras.append(f"Camera {idx}")
-                        cap.release()
-
-                if working_cameras:
-                    return test_indices[: len(working_cameras)], working_cameras
-
-            # If still no cameras found, return empty lists
-            if not camera_names:
-                return [], ["No cameras found"]
-
-            return camera_indices, camera_names
-
-        except Exception as e:
-            print(f"Error detecting cameras: {str(e)}")
-            return [], ["No cameras found"]
-    else:
-        # Unix-like systems (Linux/Mac) camera detection
-        camera_indices = []
-        camera_names = []
-
-        if platform.system() == "Darwin":  # macOS specific handling
-            # Try to open the default FaceTime camera first
-            cap = cv2.VideoCapture(0)
-            if cap.isOpened():
-                camera_indices.append(0)
-                camera_names.append("FaceTime Camera")
-                cap.release()
-
-            # On macOS, additional cameras typically use indices 1 and 2
-            for i in [1, 2]:
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    camera_indices.append(i)
-                    camera_names.append(f"Camera {i}")
-                    cap.release()
-        else:
-            # Linux camera detection - test first 10 indices
-            for i in range(10):
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    camera_indices.append(i)
-                    camera_names.append(f"Camera {i}")
-                    cap.release()
+    """Returns a list of available camera names and indices from the camera registry."""
+    try:
+        cameras = get_camera_registry().cameras()
+    except Exception as e:
+        print(f"Error detecting cameras: {str(e)}")
+        return [], ["No cameras found"]
 
-        if not camera_names:
-            return [], ["No cameras found"]
+    if not cameras:
+        return [], ["No cameras found"]
 
-        return camera_indices, camera_names
+    return [camera.index for camera in cameras], [camera.name for camera in cameras]
 
 
 def create_webcam_preview(camera_index: int):
     global preview_label, PREVIEW
 
+    # The camera registry must not reopen the device while the preview holds it
+    camera_registry = get_camera_registry()
+    camera_registry.mark_in_use(camera_index)
     cap = VideoCapturer(camera_index)
-    if not cap.start(PREVIEW_DEFAULT_WIDTH, PREVIEW_DEFAULT_HEIGHT, 60):
+    # Threaded capture overlaps device reads with frame processing
+    if not cap.start(PREVIEW_DEFAULT_WIDTH, PREVIEW_DEFAULT_HEIGHT, 60, threaded=True):
+        camera_registry.mark_in_use(camera_index, False)
         update_status("Failed to start camera")
         return
 
@@ -886,77 +834,84 @@ def create_webcam_preview(camera_index: int):
     frame_count = 0
     fps = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        temp_frame = frame.copy()
-
-        if modules.globals.live_mirror:
-            temp_frame = cv2.flip(temp_frame, 1)
-
-        if modules.globals.live_resizable:
-            temp_frame = fit_image_to_size(
-                temp_frame, PREVIEW.winfo_width(), PREVIEW.winfo_height()
-            )
-
-        else:
-            temp_frame = fit_image_to_size(
-                temp_frame, PREVIEW.winfo_width(), PREVIEW.winfo_height()
-            )
-
-        if not modules.globals.map_faces:
-            if source_image is None and modules.globals.source_path:
-                source_image = get_one_face(cv2.imread(modules.globals.source_path))
-
-            for frame_processor in frame_processors:
-                if frame_processor.NAME == "DLC.FACE-ENHANCER":
-                    if modules.globals.fp_ui["face_enhancer"]:
-                        temp_frame = frame_processor.process_frame(None, temp_frame)
-                else:
-                    temp_frame = frame_processor.process_frame(source_image, temp_frame)
-        else:
-            modules.globals.target_path = None
-            for frame_processor in frame_processors:
-                if frame_processor.NAME == "DLC.FACE-ENHANCER":
-                    if modules.globals.fp_ui["face_enhancer"]:
-                        temp_frame = frame_processor.process_frame_v2(temp_frame)
-                else:
-                    temp_frame = frame_processor.process_frame_v2(temp_frame)
-
-        # Calculate and display FPS
-        current_time = time.time()
-        frame_count += 1
-        if current_time - prev_time >= fps_update_interval:
-            fps = frame_count / (current_time - prev_time)
-            frame_count = 0
-            prev_time = current_time
-
-        if modules.globals.show_fps:
-            cv2.putText(
-                temp_frame,
-                f"FPS: {fps:.1f}",
-                (10, 30),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                1,
-                (0, 255, 0),
-                2,
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+
+            temp_frame = frame.copy()
+
+            if modules.globals.live_mirror:
+                temp_frame = cv2.flip(temp_frame, 1)
+
+            if modules.globals.live_resizable:
+                temp_frame = fit_image_to_size(
+                    temp_frame, PREVIEW.winfo_width(), PREVIEW.winfo_height()
+                )
+
+            else:
+                temp_frame = fit_image_to_size(
+                    temp_frame, PREVIEW.winfo_width(), PREVIEW.winfo_height()
+                )
+
+            # Faces found by the swapper are reused by the enhancer on the same frame
+            frame_context = FrameContext(live=True)
+            if not modules.globals.map_faces:
+                if source_image is None and modules.globals.source_path:
+                    source_image = get_one_face(cv2.imread(modules.globals.source_path))
+
+                for frame_processor in frame_processors:
+                    if frame_processor.NAME == "DLC.FACE-ENHANCER":
+                        if modules.globals.fp_ui["face_enhancer"]:
+                            temp_frame = frame_processor.process_frame(None, temp_frame, frame_context)
+                    else:
+                        temp_frame = frame_processor.process_frame(source_image, temp_frame, frame_context)
+            else:
+                modules.globals.target_path = None
+                for frame_processor in frame_processors:
+                    if frame_processor.NAME == "DLC.FACE-ENHANCER":
+                        if modules.globals.fp_ui["face_enhancer"]:
+                            temp_frame = frame_processor.process_frame_v2(temp_frame, "", frame_context)
+                    else:
+                        temp_frame = frame_processor.process_frame_v2(temp_frame, "", frame_context)
+
+            # Calculate and display FPS
+            current_time = time.time()
+            frame_count += 1
+            if current_time - prev_time >= fps_update_interval:
+                fps = frame_count / (current_time - prev_time)
+                frame_count = 0
+                prev_time = current_time
+
+            if modules.globals.show_fps:
+                fps_text = f"FPS: {fps:.1f}"
+                if modules.globals.adaptive_detection and get_last_detection_size():
+                    fps_text += f" DET: {get_last_detection_size()}"
+                cv2.putText(
+                    temp_frame,
+                    fps_text,
+                    (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    1,
+                    (0, 255, 0),
+                    2,
+                )
+
+            image = cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB)
+            image = Image.fromarray(image)
+            image = ImageOps.contain(
+                image, (temp_frame.shape[1], temp_frame.shape[0]), Image.LANCZOS
             )
-
-        image = cv2.cvtColor(temp_frame, cv2.COLOR_BGR2RGB)
-        image = Image.fromarray(image)
-        image = ImageOps.contain(
-            image, (temp_frame.shape[1], temp_frame.shape[0]), Image.LANCZOS
-        )
-        image = ctk.CTkImage(image, size=image.size)
-        preview_label.configure(image=image)
-        ROOT.update()
-
-        if PREVIEW.state() == "withdrawn":
-            break
-
-    cap.release()
+            image = ctk.CTkImage(image, size=image.size)
+            preview_label.configure(image=image)
+            ROOT.update()
+
+            if PREVIEW.state() == "withdrawn":
+                break
+    finally:
+        cap.release()
+        camera_registry.mark_in_use(camera_index, False)
     PREVIEW.withdraw()
 
 
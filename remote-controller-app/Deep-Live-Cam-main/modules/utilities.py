@@ -1,4 +1,5 @@
 import glob
+import json
 import mimetypes
 import os
 import platform
@@ -7,7 +8,7 @@ import ssl
 import subprocess
 import urllib
 from pathlib import Path
-from typing import List, Any
+from typing import List, Any, Tuple
 from tqdm import tqdm
 
 import modules.globals
@@ -60,6 +61,82 @@ def detect_fps(target_path: str) -> float:
     return 30.0
 
 
+def detect_resolution(target_path: str) -> Tuple[int, int]:
+    """Size of the frames ffmpeg decodes, which it rotates upright for videos with rotation metadata."""
+    command = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,height:stream_tags=rotate:stream_side_data=rotation",
+        "-of",
+        "json",
+        target_path,
+    ]
+    stream = json.loads(subprocess.check_output(command))["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+    # Older ffmpeg reports a rotate tag, newer ones a display matrix side data
+    rotation = stream.get("tags", {}).get("rotate", 0)
+    for side_data in stream.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    if int(float(rotation)) % 180:
+        width, height = height, width
+    return width, height
+
+
+def open_ffmpeg(args: List[str], **kwargs: Any) -> subprocess.Popen:
+    commands = [
+        "ffmpeg",
+        "-hide_banner",
+        "-hwaccel",
+        "auto",
+        "-loglevel",
+        modules.globals.log_level,
+    ]
+    commands.extend(args)
+    return subprocess.Popen(commands, **kwargs)
+
+
+def open_frame_reader(target_path: str) -> subprocess.Popen:
+    """Starts ffmpeg decoding target_path to raw bgr24 frames on stdout."""
+    return open_ffmpeg(
+        ["-i", target_path, "-f", "rawvideo", "-pix_fmt", "bgr24", "-"],
+        stdout=subprocess.PIPE,
+    )
+
+
+def open_frame_writer(target_path: str, width: int, height: int, fps: float = 30.0) -> subprocess.Popen:
+    """Starts ffmpeg encoding raw bgr24 frames from stdin into the temp output video."""
+    temp_output_path = get_temp_output_path(target_path)
+    return open_ffmpeg(
+        [
+            "-f",
+            "rawvideo",
+            "-pix_fmt",
+            "bgr24",
+            "-s",
+            f"{width}x{height}",
+            "-r",
+            str(fps),
+            "-i",
+            "-",
+            "-c:v",
+            modules.globals.video_encoder,
+            "-crf",
+            str(modules.globals.video_quality),
+            "-pix_fmt",
+            "yuv420p",
+            "-vf",
+            "colorspace=bt709:iall=bt601-6-625:fast=1",
+            "-y",
+            temp_output_path,
+        ],
+        stdin=subprocess.PIPE,
+    )
+
+
 def extract_frames(target_path: str) -> None:
     temp_directory_path = get_temp_directory_path(target_path)
     run_ffmpeg(
@@ -1,14 +1,25 @@
 import cv2
 import numpy as np
-from typing import Optional, Tuple, Callable
+from typing import Optional, Tuple, Callable, List
 import platform
 import threading
+import time
 
 # Only import Windows-specific library if on Windows
 if platform.system() == "Windows":
     from pygrabber.dshow_graph import FilterGraph
 
 
+class CapturedFrame:
+    """A frame from the capture ring with its monotonic capture time and sequence number."""
+
+    def __init__(self, frame: np.ndarray, timestamp: float, sequence: int, slot: int):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.sequence = sequence
+        self.slot = slot
+
+
 class VideoCapturer:
     def __init__(self, device_index: int):
         self.device_index = device_index
@@ -18,6 +29,17 @@ class VideoCapturer:
         self.is_running = False
         self.cap = None
 
+        # Threaded mode: a reader thread fills a ring of preallocated buffers
+        self.threaded = False
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self._buffers: List[Optional[np.ndarray]] = []
+        self._latest: Optional[CapturedFrame] = None
+        self._held_slot: Optional[int] = None
+        self._last_read_sequence = 0
+        self._condition = threading.Condition()
+        self._reader_thread = None
+
         # Initialize Windows-specific components if on Windows
         if platform.system() == "Windows":
             self.graph = FilterGraph()
@@ -28,8 +50,20 @@ class VideoCapturer:
                     f"Invalid device index {device_index}. Available devices: {len(devices)}"
                 )
 
-    def start(self, width: int = 960, height: int = 540, fps: int = 60) -> bool:
-        """Initialize and start video capture"""
+    def start(
+        self,
+        width: int = 960,
+        height: int = 540,
+        fps: int = 60,
+        threaded: bool = False,
+        buffer_count: int = 4,
+    ) -> bool:
+        """
+        Initialize and start video capture.
+        With threaded=True a background thread keeps reading frames into a ring
+        of buffer_count preallocated buffers, so read() returns the newest frame
+        without waiting on the device.
+        """
         try:
             if platform.system() == "Windows":
                 # Windows-specific capture methods
@@ -61,6 +95,8 @@ class VideoCapturer:
             self.cap.set(cv2.CAP_PROP_FPS, fps)
 
             self.is_running = True
+            if threaded:
+                self._start_reader(max(3, buffer_count))
             return True
 
         except Exception as e:
@@ -70,10 +106,23 @@ class VideoCapturer:
             return False
 
     def read(self) -> Tuple[bool, Optional[np.ndarray]]:
-        """Read a frame from the camera"""
+        """
+        Read a frame from the camera.
+        In threaded mode this waits for a frame newer than the last one read and
+        returns the ring buffer itself; it stays valid until the next read.
+        It only fails once the reader thread has stopped, not on a slow frame.
+        """
         if not self.is_running or self.cap is None:
             return False, None
 
+        if self.threaded:
+            captured = self.wait_for_frame(self._last_read_sequence)
+            while captured is None and self.is_running:
+                captured = self.wait_for_frame(self._last_read_sequence)
+            if captured is None:
+                return False, None
+            return True, captured.frame
+
         ret, frame = self.cap.read()
         if ret:
             self._current_frame = frame
@@ -82,13 +131,88 @@ class VideoCapturer:
             return True, frame
         return False, None
 
+    def read_latest(self) -> Optional[CapturedFrame]:
+        """Return the newest captured frame without blocking, or None before the first frame."""
+        with self._condition:
+            return self._hold(self._latest)
+
+    def wait_for_frame(self, last_sequence: int, timeout: float = 1.0) -> Optional[CapturedFrame]:
+        """Wait for a frame with a sequence number greater than last_sequence."""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self.is_running
+                or (self._latest is not None and self._latest.sequence > last_sequence),
+                timeout,
+            )
+            if self._latest is None or self._latest.sequence <= last_sequence:
+                return None
+            return self._hold(self._latest)
+
     def release(self) -> None:
         """Stop capture and release resources"""
-        if self.is_running and self.cap is not None:
-            self.cap.release()
+        # The reader thread clears is_running itself when the device fails
+        if self.cap is not None:
             self.is_running = False
+            with self._condition:
+                self._condition.notify_all()
+            if self._reader_thread is not None:
+                self._reader_thread.join(timeout=2.0)
+                self._reader_thread = None
+            self.cap.release()
             self.cap = None
 
     def set_frame_callback(self, callback: Callable[[np.ndarray], None]) -> None:
         """Set callback for frame processing"""
         self.frame_callback = callback
+
+    def _hold(self, captured: Optional[CapturedFrame]) -> Optional[CapturedFrame]:
+        # The held slot is not overwritten until the consumer reads again
+        if captured is not None:
+            self._held_slot = captured.slot
+            self._last_read_sequence = captured.sequence
+        return captured
+
+    def _start_reader(self, buffer_count: int) -> None:
+        self.threaded = True
+        self._buffers = [None] * buffer_count
+        self._reader_thread = threading.Thread(
+            target=self._read_loop, name=f"video-capture-{self.device_index}", daemon=True
+        )
+        self._reader_thread.start()
+
+    def _next_slot(self) -> int:
+        with self._condition:
+            busy = {self._held_slot, self._latest.slot if self._latest else None}
+        return next(slot for slot in range(len(self._buffers)) if slot not in busy)
+
+    def _read_loop(self) -> None:
+        sequence = 0
+        failures = 0
+        while self.is_running:
+            slot = self._next_slot()
+            ret, frame = self.cap.read(self._buffers[slot])
+            timestamp = time.monotonic()
+            if not ret or frame is None:
+                failures += 1
+                if failures > 100:
+                    print(f"Camera {self.device_index} stopped delivering frames.")
+                    break
+                time.sleep(0.01)
+                continue
+            failures = 0
+            # OpenCV allocates a new array on the first read or when the format changes
+            self._buffers[slot] = frame
+
+            sequence += 1
+            with self._condition:
+                if self._latest is not None and self._latest.sequence > self._last_read_sequence:
+                    self.frames_dropped += 1
+                self._latest = CapturedFrame(frame, timestamp, sequence, slot)
+                self.frames_captured += 1
+                self._condition.notify_all()
+            if self.frame_callback:
+                self.frame_callback(frame)
+
+        self.is_running = False
+        with self._condition:
+            self._condition.notify_all()
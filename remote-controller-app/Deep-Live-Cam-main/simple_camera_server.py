@@ -1,8 +1,7 @@
 import os
-import cv2
-import platform
 from flask import Flask, jsonify
 from flask_cors import CORS
+from modules.camera_registry import get_camera_registry
 
 app = Flask(__name__)
 CORS(app)
@@ -10,61 +9,17 @@ CORS(app)
 CURRENT_CAMERA_INDEX = 0
 
 def get_available_cameras():
-    """Returns a list of available camera names and indices."""
-    if platform.system() == "Windows":
-        try:
-            camera_indices = []
-            camera_names = []
-            
-            # Try first 10 camera indices
-            for i in range(10):
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    camera_indices.append(i)
-                    camera_names.append(f"Camera {i}")
-                    cap.release()
-            
-            if not camera_names:
-                return [], ["No cameras found"]
-            
-            return camera_indices, camera_names
-            
-        except Exception as e:
-            print(f"Error detecting cameras: {str(e)}")
-            return [], ["No cameras found"]
-    else:
-        # Unix-like systems (Linux/Mac) camera detection
-        camera_indices = []
-        camera_names = []
-
-        if platform.system() == "Darwin":  # macOS specific handling
-            # Try to open the default FaceTime camera first
-            cap = cv2.VideoCapture(0)
-            if cap.isOpened():
-                camera_indices.append(0)
-                camera_names.append("FaceTime Camera")
-                cap.release()
-
-            # On macOS, additional cameras typically use indices 1 and 2
-            for i in [1, 2]:
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    camera_indices.append(i)
-                    camera_names.append(f"Camera {i}")
-                    cap.release()
-        else:
-            # Linux camera detection - test first 10 indices
-            for i in range(10):
-                cap = cv2.VideoCapture(i)
-                if cap.isOpened():
-                    camera_indices.append(i)
-                    camera_names.append(f"Camera {i}")
-                    cap.release()
+    """Returns a list of available camera names and indices from the camera registry."""
+    try:
+        cameras = get_camera_registry().cameras()
+    except Exception as e:
+        print(f"Error detecting cameras: {str(e)}")
+        return [], ["No cameras found"]
 
-        if not camera_names:
-            return [], ["No cameras found"]
+    if not cameras:
+        return [], ["No cameras found"]
 
-        return camera_indices, camera_names
+    return [camera.index for camera in cameras], [camera.name for camera in cameras]
 
 @app.route('/get_cameras', methods=['GET'])
 def get_cameras():
@@ -102,12 +57,10 @@ def set_camera():
     camera_index = data['camera_index']
     
     try:
-        # Validate camera index by trying to open it
-        cap = cv2.VideoCapture(camera_index)
-        if not cap.isOpened():
-            cap.release()
+        # Validate camera index against the registry instead of reopening the device
+        if get_camera_registry().get(camera_index) is None:
+            get_camera_registry().request_refresh()
             return jsonify({"error": f"Camera {camera_index} is not available"}), 400
-        cap.release()
         
         CURRENT_CAMERA_INDEX = camera_index
         print(f"Camera set to index: {camera_index}")